@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import seaborn as sns
 from matplotlib.backends.backend_pdf import PdfPages
 import io
@@ -408,7 +409,8 @@ class AnalysisReporter:
                     continue
                 
                 # 创建图表
-                fig, ax = plt.subplots(figsize=(10, 6))
+                fig = Figure(figsize=(10, 6))
+                ax = fig.subplots()
                 
                 # 生成横轴日期标签
                 date_labels = [f"{year}-{month}" for year, month in zip(material_data['年份'], material_data['月份'])]
@@ -433,8 +435,8 @@ class AnalysisReporter:
                 ax.legend()
                 
                 # 旋转x轴标签
-                plt.xticks(rotation=45)
-                plt.tight_layout()
+                ax.tick_params(axis='x', labelrotation=45)
+                fig.tight_layout()
                 
                 # 添加到图表字典
                 charts[material_id] = fig
@@ -448,7 +450,8 @@ class AnalysisReporter:
             overall_data = overall_data.sort_values(['年份', '月份'])
             
             # 创建整体趋势图
-            fig, ax = plt.subplots(figsize=(10, 6))
+            fig = Figure(figsize=(10, 6))
+            ax = fig.subplots()
             
             # 生成横轴日期标签
             date_labels = [f"{year}-{month}" for year, month in zip(overall_data['年份'], overall_data['月份'])]
@@ -471,8 +474,8 @@ class AnalysisReporter:
             ax.legend()
             
             # 旋转x轴标签
-            plt.xticks(rotation=45)
-            plt.tight_layout()
+            ax.tick_params(axis='x', labelrotation=45)
+            fig.tight_layout()
             
             # 添加到图表字典
             charts['overall'] = fig
@@ -485,7 +488,8 @@ class AnalysisReporter:
             accuracy_data = accuracy_data.sort_values(['年份', '月份'])
             
             # 创建准确率趋势图
-            fig, ax = plt.subplots(figsize=(10, 6))
+            fig = Figure(figsize=(10, 6))
+            ax = fig.subplots()
             
             # 生成横轴日期标签
             date_labels = [f"{year}-{month}" for year, month in zip(accuracy_data['年份'], accuracy_data['月份'])]
@@ -511,8 +515,8 @@ class AnalysisReporter:
             ax.legend()
             
             # 旋转x轴标签
-            plt.xticks(rotation=45)
-            plt.tight_layout()
+            ax.tick_params(axis='x', labelrotation=45)
+            fig.tight_layout()
             
             # 添加到图表字典
             charts['accuracy'] = fig
@@ -673,9 +677,7 @@ class AnalysisReporter:
                 return pd.DataFrame(columns=['物料编号', '产品类别', '当前准确率(%)', '建议', '建议预测方法', '置信区间调整'])
                 
         except Exception as e:
-            logger.error(f"生成模型建议失败: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception(f"生成模型建议失败: {str(e)}")
             return None
     
     def calculate_confidence_intervals(self, target_period=None):
@@ -848,9 +850,7 @@ class AnalysisReporter:
             return report
             
         except Exception as e:
-            logger.error(f"生成分析报告失败: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception(f"生成分析报告失败: {str(e)}")
             return None
     
     def export_excel_report(self, output_path):
@@ -1040,7 +1040,5 @@ class AnalysisReporter:
             return True
             
         except Exception as e:
-            logger.error(f"导出PDF报告失败: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception(f"导出PDF报告失败: {str(e)}")
             return False
\ No newline at end of file
@@ -3,7 +3,7 @@ import numpy as np
 import networkx as nx
 import logging
 import os
-from collections import defaultdict
+from collections import deque
 
 # 配置日志
 logging.basicConfig(
@@ -17,6 +17,31 @@ MATERIAL_TYPE_FINISHED = "成品"
 MATERIAL_TYPE_SEMIFINISHED = "半成品"
 MATERIAL_TYPE_RAW = "基础原料"
 
+# 可选依赖：安装numba时，大型BOM的需求分解使用JIT编译
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# BOM边数达到该值时才使用numba内核，小型BOM不值得付出编译开销
+NUMBA_MIN_EDGES = 10000
+
+def _rollup_requirements(demand, indptr, child_idx, quantities):
+    """按拓扑顺序将每个物料的需求逐层分解到子件，返回每个物料的总需求"""
+    requirements = demand.copy()
+    
+    for node in range(len(indptr) - 1):
+        amount = requirements[node]
+        if amount != 0:
+            for k in range(indptr[node], indptr[node + 1]):
+                requirements[child_idx[k]] += amount * quantities[k]
+    
+    return requirements
+
+if NUMBA_AVAILABLE:
+    _rollup_requirements_kernel = njit(cache=True)(_rollup_requirements)
+
 class BOMManager:
     """
     物料清单(BOM)管理模块，负责BOM数据的导入、验证和处理
@@ -30,6 +55,8 @@ class BOMManager:
         self.material_info = {}  # 存储物料的附加信息，包括物料类型
         self.suppliers = {}  # 存储供应商信息
         self.material_types = {}  # 存储每个物料的类型
+        self._bom_arrays = None  # BOM图的CSR数组表示，按拓扑顺序编号
+        self._bom_arrays_source = None
     
     def load_bom_data(self, file_path):
         """
@@ -332,6 +359,81 @@ class BOMManager:
             logger.warning(f"物料 {material_id} 的类型未定义")
             return "未知"
     
+    def _get_bom_arrays(self):
+        """
+        将BOM图转换为CSR形式的数组，物料按拓扑顺序编号，BOM图对象未变化时复用
+        
+        返回:
+            tuple: (物料列表, 物料 -> 编号, 子件起止位置, 子件编号, 单位用量)
+        """
+        if self._bom_arrays is not None and self._bom_arrays_source is self.bom_graph:
+            return self._bom_arrays
+        
+        nodes = list(nx.topological_sort(self.bom_graph))
+        node_index = {node: i for i, node in enumerate(nodes)}
+        
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        child_idx = []
+        quantities = []
+        
+        for i, node in enumerate(nodes):
+            for _, child, quantity in self.bom_graph.out_edges(node, data='quantity'):
+                child_idx.append(node_index[child])
+                quantities.append(quantity)
+            indptr[i + 1] = len(child_idx)
+        
+        self._bom_arrays = (
+            nodes,
+            node_index,
+            indptr,
+            np.asarray(child_idx, dtype=np.int64),
+            np.asarray(quantities, dtype=np.float64)
+        )
+        self._bom_arrays_source = self.bom_graph
+        
+        return self._bom_arrays
+    
+    def _rollup_plan_requirements(self, production_plan, target_type):
+        """
+        将生产计划中成品的计划产量沿BOM逐层分解，汇总指定类型的叶子物料需求
+        
+        参数:
+            production_plan: DataFrame，包含物料编号和计划产量
+            target_type: 需要汇总的物料类型
+            
+        返回:
+            dict: 物料编号 -> 需求量
+        """
+        nodes, node_index, indptr, child_idx, quantities = self._get_bom_arrays()
+        
+        # 同一成品的多条计划先合并
+        plan_totals = production_plan.groupby('物料编号', sort=False)['计划产量'].sum()
+        
+        demand = np.zeros(len(nodes))
+        for material_id, quantity in plan_totals.items():
+            # 确认是否为成品
+            if self.get_material_type(material_id) != MATERIAL_TYPE_FINISHED or material_id not in node_index:
+                logger.warning(f"物料 {material_id} 不是成品，跳过")
+                continue
+            demand[node_index[material_id]] += quantity
+        
+        # 逐层分解需求，大型BOM使用numba内核
+        if NUMBA_AVAILABLE and len(child_idx) >= NUMBA_MIN_EDGES:
+            requirements = _rollup_requirements_kernel(demand, indptr, child_idx, quantities)
+        else:
+            requirements = _rollup_requirements(
+                demand.tolist(), indptr.tolist(), child_idx.tolist(), quantities.tolist()
+            )
+        
+        # 与展开BOM一致，只统计没有子件的物料
+        is_leaf = indptr[1:] == indptr[:-1]
+        
+        return {
+            nodes[i]: requirements[i]
+            for i in np.flatnonzero(is_leaf)
+            if requirements[i] != 0 and self.material_types.get(nodes[i]) == target_type
+        }
+    
     def explode_bom(self, material_id, levels=None, material_type=None):
         """
         展开BOM，获取所有组件及其用量
@@ -353,23 +455,26 @@ class BOMManager:
             return None
         
         try:
-            # 使用BFS展开BOM
+            nodes, node_index, indptr, child_idx, quantities = self._get_bom_arrays()
+            
+            # 使用BFS展开BOM，子件从CSR数组的连续区间中读取
+            # BOM按拓扑顺序编号（无循环引用），共用的半成品经每条路径都展开一次，与需求汇总的结果一致
             components = []
-            visited = set()
-            queue = [(material_id, 1, 0, 1)]  # (物料编号, 用量, 层级, 路径乘数)
+            queue = deque([(node_index[material_id], 1, 0, 1)])  # (物料序号, 用量, 层级, 路径乘数)
             
             while queue:
-                current, qty, level, path_multiplier = queue.pop(0)
+                current_idx, qty, level, path_multiplier = queue.popleft()
+                current = nodes[current_idx]
                 
                 # 如果达到指定层级，则停止展开
                 if levels is not None and level > levels:
                     continue
                 
                 # 获取子件
-                children = self.get_material_children(current)
+                start, end = indptr[current_idx], indptr[current_idx + 1]
                 
                 # 如果是叶子节点(无子件)或已达最大层级，则添加到组件列表
-                if not children or (levels is not None and level == levels):
+                if start == end or (levels is not None and level == levels):
                     if current != material_id:  # 不包括顶级物料自身
                         # 获取物料类型
                         mat_type = self.get_material_type(current)
@@ -394,11 +499,9 @@ class BOMManager:
                             '层级': level
                         })
                 
-                # 将未访问过的子件加入队列
-                for child, child_qty in children:
-                    if (current, child) not in visited:
-                        visited.add((current, child))
-                        queue.append((child, child_qty, level + 1, path_multiplier * qty))
+                # 将子件加入队列
+                for k in range(start, end):
+                    queue.append((child_idx[k], quantities[k], level + 1, path_multiplier * qty))
             
             # 转换为DataFrame
             if components:
@@ -449,31 +552,8 @@ class BOMManager:
             return None
         
         try:
-            # 存储基础原料的总需求
-            raw_requirements = defaultdict(float)
-            
-            # 处理每个产品
-            for _, row in production_plan.iterrows():
-                material_id = row['物料编号']
-                quantity = row['计划产量']
-                
-                # 确认是否为成品
-                material_type = self.get_material_type(material_id)
-                if material_type != MATERIAL_TYPE_FINISHED:
-                    logger.warning(f"物料 {material_id} 不是成品，跳过")
-                    continue
-                
-                # 展开该产品的BOM，只获取基础原料
-                exploded_bom = self.explode_bom(material_id, material_type=MATERIAL_TYPE_RAW)
-                
-                if exploded_bom is not None and not exploded_bom.empty:
-                    # 累加该产品对应的基础原料需求
-                    for _, comp_row in exploded_bom.iterrows():
-                        comp_id = comp_row['组件编号']
-                        comp_qty = comp_row['总用量']
-                        
-                        # 累加到总需求中
-                        raw_requirements[comp_id] += comp_qty * quantity
+            # 沿BOM分解所有成品的计划产量，汇总基础原料的总需求
+            raw_requirements = self._rollup_plan_requirements(production_plan, MATERIAL_TYPE_RAW)
             
             # 转换为DataFrame
             if raw_requirements:
@@ -522,31 +602,8 @@ class BOMManager:
             return None
         
         try:
-            # 存储半成品的总需求
-            semifinished_requirements = defaultdict(float)
-            
-            # 处理每个产品
-            for _, row in production_plan.iterrows():
-                material_id = row['物料编号']
-                quantity = row['计划产量']
-                
-                # 确认是否为成品
-                material_type = self.get_material_type(material_id)
-                if material_type != MATERIAL_TYPE_FINISHED:
-                    logger.warning(f"物料 {material_id} 不是成品，跳过")
-                    continue
-                
-                # 展开该产品的BOM，只获取半成品
-                exploded_bom = self.explode_bom(material_id, material_type=MATERIAL_TYPE_SEMIFINISHED)
-                
-                if exploded_bom is not None and not exploded_bom.empty:
-                    # 累加该产品对应的半成品需求
-                    for _, comp_row in exploded_bom.iterrows():
-                        comp_id = comp_row['组件编号']
-                        comp_qty = comp_row['总用量']
-                        
-                        # 累加到总需求中
-                        semifinished_requirements[comp_id] += comp_qty * quantity
+            # 沿BOM分解所有成品的计划产量，汇总半成品的总需求
+            semifinished_requirements = self._rollup_plan_requirements(production_plan, MATERIAL_TYPE_SEMIFINISHED)
             
             # 转换为DataFrame
             if semifinished_requirements:
@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 import logging
 import os
+import math
 from datetime import datetime, timedelta
 # 移除 from ortools.linear_solver import pywraplp
 
@@ -12,6 +13,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 启用写时复制，加载数据时无需立即复制整个DataFrame（pandas 3.0 起默认启用）
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# 可选依赖：安装numba时，大规模计划的库存递推使用JIT编译并按物料并行计算
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# 物料 × 期间 的单元数达到该值时才使用numba内核，小规模计划不值得付出编译开销
+NUMBA_MIN_CELLS = 50000
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _plan_inventory_kernel(demand_matrix, initial_inventory, min_batch_size, safety_stock_days):
+        """按物料并行执行库存递推，逻辑与 ProductionPlanner._plan_inventory 的NumPy实现一致"""
+        num_materials, num_periods = demand_matrix.shape
+        production_matrix = np.zeros((num_materials, num_periods))
+        beginning_matrix = np.empty((num_materials, num_periods))
+        ending_matrix = np.empty((num_materials, num_periods))
+        
+        for m in prange(num_materials):
+            current_inventory = initial_inventory[m]
+            for t in range(num_periods):
+                demand = demand_matrix[m, t]
+                safety_stock = demand * safety_stock_days / 30
+                net_demand = max(0.0, demand + safety_stock - current_inventory)
+                
+                production = 0.0
+                if net_demand > 0:
+                    production = math.ceil(max(net_demand, min_batch_size) / min_batch_size) * min_batch_size
+                
+                production_matrix[m, t] = production
+                beginning_matrix[m, t] = current_inventory
+                current_inventory = current_inventory + production - demand
+                ending_matrix[m, t] = current_inventory
+        
+        return production_matrix, beginning_matrix, ending_matrix
+
 class ProductionPlanner:
     """
     生产计划模块，负责根据销售预测生成优化的生产计划
@@ -26,6 +68,12 @@ class ProductionPlanner:
         self.production_plan = None
         self.optimization_result = None
         self.production_constraints = {}
+        self._forecast_index = {}
+        self._inventory_index = {}
+        self._missing_forecast_keys = set()
+        self._missing_inventory_keys = set()
+        self._plan_row_index = {}
+        self._plan_row_index_source = None
     
     def load_forecast_data(self, forecast_data):
         """
@@ -50,7 +98,23 @@ class ProductionPlanner:
                 logger.error(f"预测数据缺少必要字段: {', '.join(missing_fields)}")
                 return False
             
-            self.forecast_data = forecast_data.copy()
+            # 压缩键列的数据类型，并缓存期间序号（年份*12+月份）供排序和期数计算使用
+            # assign 返回新对象，未修改的列与调用方共享数据，不会改动调用方的DataFrame
+            self.forecast_data = forecast_data.assign(
+                年份=forecast_data['年份'].astype(np.int16),
+                月份=forecast_data['月份'].astype(np.int8),
+                物料编号=forecast_data['物料编号'].astype('category'),
+                _period=forecast_data['年份'].to_numpy(dtype=np.int32) * 12 + forecast_data['月份'].to_numpy(dtype=np.int32)
+            )
+            
+            # 建立 (物料编号, 年份, 月份) -> 预测值 的索引，同一键保留首条记录
+            unique_forecast = self.forecast_data.drop_duplicates(['物料编号', '年份', '月份'])
+            self._forecast_index = dict(zip(
+                zip(unique_forecast['物料编号'], unique_forecast['年份'], unique_forecast['月份']),
+                unique_forecast['预测值']
+            ))
+            self._missing_forecast_keys = set()
+            
             logger.info(f"成功加载预测数据，共 {len(forecast_data)} 条记录")
             return True
             
@@ -81,7 +145,16 @@ class ProductionPlanner:
                 logger.error(f"库存数据缺少必要字段: {', '.join(missing_fields)}")
                 return False
             
-            self.inventory_data = inventory_data.copy()
+            # 压缩键列的数据类型，未修改的列与调用方共享数据
+            self.inventory_data = inventory_data.assign(
+                物料编号=inventory_data['物料编号'].astype('category')
+            )
+            
+            # 建立 物料编号 -> 库存数量 的索引，同一物料保留首条记录
+            unique_inventory = self.inventory_data.drop_duplicates('物料编号')
+            self._inventory_index = dict(zip(unique_inventory['物料编号'], unique_inventory['库存数量']))
+            self._missing_inventory_keys = set()
+            
             logger.info(f"成功加载库存数据，共 {len(inventory_data)} 条记录")
             return True
             
@@ -112,7 +185,13 @@ class ProductionPlanner:
                 logger.error(f"产能数据缺少必要字段: {', '.join(missing_fields)}")
                 return False
             
-            self.capacity_data = capacity_data.copy()
+            # 压缩键列的数据类型并缓存期间序号（年份*12+月份），未修改的列与调用方共享数据
+            self.capacity_data = capacity_data.assign(
+                年份=capacity_data['年份'].astype(np.int16),
+                月份=capacity_data['月份'].astype(np.int8),
+                _period=capacity_data['年份'].to_numpy(dtype=np.int32) * 12 + capacity_data['月份'].to_numpy(dtype=np.int32)
+            )
+            
             logger.info(f"成功加载产能数据，共 {len(capacity_data)} 条记录")
             return True
             
@@ -170,14 +249,15 @@ class ProductionPlanner:
             return 0
         
         try:
-            # 筛选指定物料的库存记录
-            inventory_record = self.inventory_data[self.inventory_data['物料编号'] == material_id]
-            
-            if inventory_record.empty:
-                logger.warning(f"未找到物料 {material_id} 的库存记录，假设为0")
+            # 通过索引查找指定物料的库存记录
+            if material_id not in self._inventory_index:
+                # 每个缺失的物料只记录一次警告
+                if material_id not in self._missing_inventory_keys and logger.isEnabledFor(logging.WARNING):
+                    self._missing_inventory_keys.add(material_id)
+                    logger.warning(f"未找到物料 {material_id} 的库存记录，假设为0")
                 return 0
             else:
-                return inventory_record.iloc[0]['库存数量']
+                return self._inventory_index[material_id]
                 
         except Exception as e:
             logger.error(f"获取库存量失败: {str(e)}")
@@ -200,77 +280,61 @@ class ProductionPlanner:
         
         try:
             # 限制计划期数
-            max_forecast_periods = max(self.forecast_data['年份'] * 12 + self.forecast_data['月份']) - \
-                                 min(self.forecast_data['年份'] * 12 + self.forecast_data['月份']) + 1
+            max_forecast_periods = self.forecast_data['_period'].max() - self.forecast_data['_period'].min() + 1
             
             if horizon > max_forecast_periods:
                 logger.warning(f"计划期数 {horizon} 超过预测期数 {max_forecast_periods}，已调整为 {max_forecast_periods}")
                 horizon = max_forecast_periods
             
-            # 准备物料列表
-            materials = self.forecast_data['物料编号'].unique()
-            
-            # 准备时间段列表
-            time_periods = sorted(self.forecast_data[['年份', '月份']].drop_duplicates().itertuples(index=False, name=None),
-                               key=lambda x: x[0] * 12 + x[1])
-            
-            time_periods = time_periods[:horizon]  # 限制期数
+            # 准备物料列表（排序后按 物料 × 期间 顺序构建，结果无需再排序）
+            materials = np.sort(np.asarray(self.forecast_data['物料编号'].unique()))
             
-            # 构建生产计划DataFrame - 简化版实现
-            plan_data = []
+            # 准备时间段列表（np.unique 已排序），并限制期数
+            periods = np.unique(self.forecast_data['_period'].to_numpy())[:horizon]
+            period_years, period_months = np.divmod(periods.astype(np.int64) - 1, 12)
+            period_months += 1
             
             # 获取约束参数
             min_batch_size = self.production_constraints.get('min_batch_size', 100)
             safety_stock_days = self.production_constraints.get('safety_stock_days', 15)
             
-            # 对每个物料生成计划
-            for material in materials:
-                # 获取初始库存
-                initial_inventory = self.get_inventory_level(material)
-                current_inventory = initial_inventory
-                
-                for i, (year, month) in enumerate(time_periods):
-                    # 获取当月需求
-                    demand = self.get_forecast_demand(material, year, month)
-                    
-                    # 计算安全库存
-                    safety_stock = demand * safety_stock_days / 30
-                    
-                    # 计算净需求（需求+安全库存-库存）
-                    net_demand = max(0, demand + safety_stock - current_inventory)
-                    
-                    # 应用最小批量规则
-                    if net_demand > 0:
-                        # 如果需要生产，至少生产一个最小批量
-                        production = max(net_demand, min_batch_size)
-                        # 向上取整到最小批量的整数倍
-                        production = np.ceil(production / min_batch_size) * min_batch_size
-                    else:
-                        production = 0
-                    
-                    # 更新库存
-                    ending_inventory = current_inventory + production - demand
-                    
-                    # 保存结果
-                    plan_data.append({
-                        '年份': year,
-                        '月份': month,
-                        '物料编号': material,
-                        '预测需求': demand,
-                        '计划产量': round(production),
-                        '期初库存': round(current_inventory),
-                        '期末库存': round(ending_inventory),
-                        '库存覆盖天数': round(ending_inventory / (demand / 30), 1) if demand > 0 else float('inf')
-                    })
-                    
-                    # 更新库存到下月
-                    current_inventory = ending_inventory
-            
-            # 创建DataFrame
-            plan_df = pd.DataFrame(plan_data)
-            
-            # 排序
-            plan_df = plan_df.sort_values(['物料编号', '年份', '月份'])
+            # 构建需求矩阵（物料 × 期间），缺失的预测按0处理
+            demand_matrix = self.forecast_data.pivot_table(
+                index='物料编号',
+                columns='_period',
+                values='预测值',
+                aggfunc='first',
+                fill_value=0,
+                observed=True
+            ).reindex(index=materials, columns=periods, fill_value=0).to_numpy(dtype=np.float64)
+            
+            # 一次性获取所有物料的初始库存
+            if self.inventory_data is not None:
+                initial_inventory = self.inventory_data.drop_duplicates('物料编号').set_index('物料编号')['库存数量'] \
+                    .reindex(materials).fillna(0).to_numpy(dtype=np.float64)
+            else:
+                initial_inventory = np.zeros(len(materials))
+            
+            # 逐期递推计算产量和库存
+            production_matrix, beginning_matrix, ending_matrix = self._plan_inventory(
+                demand_matrix, initial_inventory, min_batch_size, safety_stock_days
+            )
+            num_materials, num_periods = demand_matrix.shape
+            
+            # 计算库存覆盖天数
+            coverage_matrix = self._calculate_coverage_days(ending_matrix, demand_matrix)
+            
+            # 按 物料 × 期间 的顺序预先展开各列，直接由数组创建DataFrame
+            plan_df = pd.DataFrame({
+                '年份': np.tile(period_years, num_materials),
+                '月份': np.tile(period_months, num_materials),
+                '物料编号': np.repeat(materials, num_periods),
+                '预测需求': demand_matrix.ravel(),
+                '计划产量': np.rint(production_matrix.ravel()).astype(np.int64),
+                '期初库存': np.rint(beginning_matrix.ravel()).astype(np.int64),
+                '期末库存': np.rint(ending_matrix.ravel()).astype(np.int64),
+                '库存覆盖天数': coverage_matrix.ravel()
+            })
             
             # 保存结果
             self.production_plan = plan_df
@@ -284,9 +348,7 @@ class ProductionPlanner:
             return plan_df
             
         except Exception as e:
-            logger.error(f"生成生产计划失败: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception(f"生成生产计划失败: {str(e)}")
             return None
     
     def get_forecast_demand(self, material_id, year, month):
@@ -305,18 +367,17 @@ class ProductionPlanner:
             return 0
         
         try:
-            # 筛选指定物料和月份的预测记录
-            forecast_record = self.forecast_data[
-                (self.forecast_data['物料编号'] == material_id) & 
-                (self.forecast_data['年份'] == year) & 
-                (self.forecast_data['月份'] == month)
-            ]
-            
-            if forecast_record.empty:
-                logger.warning(f"未找到物料 {material_id} 在 {year}-{month} 的预测记录，假设为0")
+            # 通过索引查找指定物料和月份的预测记录
+            key = (material_id, year, month)
+            
+            if key not in self._forecast_index:
+                # 每个缺失的键只记录一次警告
+                if key not in self._missing_forecast_keys and logger.isEnabledFor(logging.WARNING):
+                    self._missing_forecast_keys.add(key)
+                    logger.warning(f"未找到物料 {material_id} 在 {year}-{month} 的预测记录，假设为0")
                 return 0
             else:
-                return forecast_record.iloc[0]['预测值']
+                return self._forecast_index[key]
                 
         except Exception as e:
             logger.error(f"获取预测需求失败: {str(e)}")
@@ -341,26 +402,26 @@ class ProductionPlanner:
         
         try:
             # 定位需要调整的行
-            mask = ((self.production_plan['物料编号'] == material_id) & 
-                  (self.production_plan['年份'] == year) & 
-                  (self.production_plan['月份'] == month))
+            row = self._get_plan_row_index().get((material_id, year, month))
             
-            if not any(mask):
+            if row is None:
                 logger.error(f"未找到要调整的计划: 物料={material_id}, 年月={year}-{month}")
                 return False
             
+            plan = self.production_plan
+            
             # 获取原计划产量
-            original_production = self.production_plan.loc[mask, '计划产量'].values[0]
+            original_production = plan.at[row, '计划产量']
             
             # 调整计划产量
-            self.production_plan.loc[mask, '计划产量'] = new_production
+            plan.at[row, '计划产量'] = new_production
             
             # 重新计算库存
             # 更新当前月的期末库存
-            demand = self.production_plan.loc[mask, '预测需求'].values[0]
-            beginning_inventory = self.production_plan.loc[mask, '期初库存'].values[0]
+            demand = plan.at[row, '预测需求']
+            beginning_inventory = plan.at[row, '期初库存']
             new_ending_inventory = beginning_inventory + new_production - demand
-            self.production_plan.loc[mask, '期末库存'] = new_ending_inventory
+            plan.at[row, '期末库存'] = new_ending_inventory
             
             # 更新库存覆盖天数
             if demand > 0:
@@ -368,7 +429,7 @@ class ProductionPlanner:
             else:
                 new_coverage_days = float('inf')
             
-            self.production_plan.loc[mask, '库存覆盖天数'] = new_coverage_days
+            plan.at[row, '库存覆盖天数'] = new_coverage_days
             
             # 更新后续月份的库存
             self.propagate_inventory_changes(material_id, year, month)
@@ -382,6 +443,111 @@ class ProductionPlanner:
             logger.error(f"调整生产计划失败: {str(e)}")
             return False
     
+    def _plan_inventory(self, demand_matrix, initial_inventory, min_batch_size, safety_stock_days):
+        """
+        按期递推计算各物料的计划产量和期初/期末库存
+        
+        参数:
+            demand_matrix: 需求矩阵（物料 × 期间）
+            initial_inventory: 各物料初始库存
+            min_batch_size: 最小生产批量
+            safety_stock_days: 安全库存天数
+            
+        返回:
+            tuple: (计划产量矩阵, 期初库存矩阵, 期末库存矩阵)
+        """
+        # 全期无需求且库存非负的物料无需生产，库存保持不变，直接批量填充
+        active = demand_matrix.any(axis=1) | (initial_inventory < 0)
+        
+        if not active.all():
+            num_periods = demand_matrix.shape[1]
+            production_matrix = np.zeros(demand_matrix.shape)
+            beginning_matrix = np.repeat(initial_inventory[:, None], num_periods, axis=1).astype(np.float64)
+            ending_matrix = beginning_matrix.copy()
+            
+            if active.any():
+                production_matrix[active], beginning_matrix[active], ending_matrix[active] = self._plan_inventory(
+                    demand_matrix[active], initial_inventory[active], min_batch_size, safety_stock_days
+                )
+            
+            return production_matrix, beginning_matrix, ending_matrix
+        
+        if NUMBA_AVAILABLE and demand_matrix.size >= NUMBA_MIN_CELLS:
+            return _plan_inventory_kernel(
+                np.ascontiguousarray(demand_matrix, dtype=np.float64),
+                np.ascontiguousarray(initial_inventory, dtype=np.float64),
+                float(min_batch_size),
+                float(safety_stock_days)
+            )
+        
+        # 计算安全库存
+        safety_matrix = demand_matrix * safety_stock_days / 30
+        
+        num_materials, num_periods = demand_matrix.shape
+        production_matrix = np.zeros((num_materials, num_periods))
+        beginning_matrix = np.empty((num_materials, num_periods))
+        ending_matrix = np.empty((num_materials, num_periods))
+        
+        # 逐期递推，每期对所有物料做向量运算
+        current_inventory = initial_inventory
+        for t in range(num_periods):
+            demand = demand_matrix[:, t]
+            
+            # 计算净需求（需求+安全库存-库存）
+            net_demand = np.maximum(0, demand + safety_matrix[:, t] - current_inventory)
+            
+            # 应用最小批量规则：需要生产时至少生产一个最小批量，并向上取整到最小批量的整数倍
+            production = np.where(
+                net_demand > 0,
+                np.ceil(np.maximum(net_demand, min_batch_size) / min_batch_size) * min_batch_size,
+                0
+            )
+            
+            # 更新库存
+            ending_inventory = current_inventory + production - demand
+            
+            production_matrix[:, t] = production
+            beginning_matrix[:, t] = current_inventory
+            ending_matrix[:, t] = ending_inventory
+            
+            # 更新库存到下月
+            current_inventory = ending_inventory
+        
+        return production_matrix, beginning_matrix, ending_matrix
+    
+    def _calculate_coverage_days(self, ending_inventory, demand):
+        """
+        批量计算库存覆盖天数，需求为0时覆盖天数为无穷大
+        
+        参数:
+            ending_inventory: 期末库存数组
+            demand: 需求数组
+            
+        返回:
+            ndarray: 库存覆盖天数（保留1位小数）
+        """
+        coverage_days = np.full(np.shape(demand), np.inf)
+        np.divide(ending_inventory, np.asarray(demand) / 30, out=coverage_days, where=np.asarray(demand) > 0)
+        return np.round(coverage_days, 1)
+    
+    def _get_plan_row_index(self):
+        """
+        获取 (物料编号, 年份, 月份) -> 行标签 的索引，生产计划被替换后自动重建
+        
+        返回:
+            dict: 计划行索引
+        """
+        if self._plan_row_index_source is not self.production_plan:
+            plan = self.production_plan
+            keys = zip(plan['物料编号'], plan['年份'], plan['月份'])
+            # 同一键保留首条记录
+            self._plan_row_index = {}
+            for key, label in zip(keys, plan.index):
+                self._plan_row_index.setdefault(key, label)
+            self._plan_row_index_source = plan
+        
+        return self._plan_row_index
+    
     def propagate_inventory_changes(self, material_id, start_year, start_month):
         """
         调整生产计划后，传播库存变化到后续月份
@@ -392,62 +558,33 @@ class ProductionPlanner:
             start_month: 起始月份
         """
         try:
-            # 获取所有计划月份
-            plan_months = self.production_plan[['年份', '月份']].drop_duplicates().values
+            # 取出该物料的计划并按时间排序
+            material_plan = self.production_plan[self.production_plan['物料编号'] == material_id] \
+                .sort_values(['年份', '月份'])
             
-            # 按时间排序
-            plan_months = sorted(plan_months, key=lambda x: x[0] * 12 + x[1])
+            # 找到起始月份的位置
+            period_keys = (material_plan['年份'] * 12 + material_plan['月份']).to_numpy()
+            start_key = start_year * 12 + start_month
+            start_idx = int(np.searchsorted(period_keys, start_key))
             
-            # 找到起始月份的索引
-            start_idx = -1
-            for i, (year, month) in enumerate(plan_months):
-                if year == start_year and month == start_month:
-                    start_idx = i
-                    break
-            
-            if start_idx == -1 or start_idx == len(plan_months) - 1:
+            if start_idx >= len(period_keys) or period_keys[start_idx] != start_key or start_idx == len(period_keys) - 1:
                 # 未找到起始月份或起始月份已是最后一个月，无需继续
                 return
             
-            # 从下一个月开始更新
-            for i in range(start_idx + 1, len(plan_months)):
-                year, month = plan_months[i]
-                
-                # 找到上一个月
-                prev_year, prev_month = plan_months[i - 1]
-                
-                # 获取当前月的记录
-                curr_mask = ((self.production_plan['物料编号'] == material_id) & 
-                           (self.production_plan['年份'] == year) & 
-                           (self.production_plan['月份'] == month))
-                
-                # 获取上一个月的记录
-                prev_mask = ((self.production_plan['物料编号'] == material_id) & 
-                           (self.production_plan['年份'] == prev_year) & 
-                           (self.production_plan['月份'] == prev_month))
-                
-                if not any(curr_mask) or not any(prev_mask):
-                    continue
-                
-                # 获取数据
-                prev_ending_inventory = self.production_plan.loc[prev_mask, '期末库存'].values[0]
-                curr_production = self.production_plan.loc[curr_mask, '计划产量'].values[0]
-                curr_demand = self.production_plan.loc[curr_mask, '预测需求'].values[0]
-                
-                # 更新当前月的期初库存
-                self.production_plan.loc[curr_mask, '期初库存'] = prev_ending_inventory
-                
-                # 更新当前月的期末库存
-                new_ending_inventory = prev_ending_inventory + curr_production - curr_demand
-                self.production_plan.loc[curr_mask, '期末库存'] = new_ending_inventory
-                
-                # 更新库存覆盖天数
-                if curr_demand > 0:
-                    new_coverage_days = round(new_ending_inventory / (curr_demand / 30), 1)
-                else:
-                    new_coverage_days = float('inf')
-                
-                self.production_plan.loc[curr_mask, '库存覆盖天数'] = new_coverage_days
+            production = material_plan['计划产量'].to_numpy(dtype=np.float64)[start_idx + 1:]
+            demand = material_plan['预测需求'].to_numpy(dtype=np.float64)[start_idx + 1:]
+            start_ending_inventory = material_plan['期末库存'].iat[start_idx]
+            
+            # 后续各月的期末库存 = 起始月期末库存 + 累计(产量 - 需求)，期初库存为上月期末库存
+            ending_inventory = start_ending_inventory + np.cumsum(production - demand)
+            beginning_inventory = np.concatenate(([start_ending_inventory], ending_inventory[:-1]))
+            
+            # 更新库存覆盖天数
+            coverage_days = self._calculate_coverage_days(ending_inventory, demand)
+            
+            # 一次性写回
+            self.production_plan.loc[material_plan.index[start_idx + 1:], ['期初库存', '期末库存', '库存覆盖天数']] = \
+                np.column_stack([beginning_inventory, ending_inventory, coverage_days])
             
         except Exception as e:
             logger.error(f"传播库存变化失败: {str(e)}")
@@ -472,7 +609,9 @@ class ProductionPlanner:
             if file_extension.lower() == '.csv':
                 self.production_plan.to_csv(file_path, index=False, encoding='utf-8-sig')
             elif file_extension.lower() in ['.xls', '.xlsx']:
-                self.production_plan.to_excel(file_path, index=False)
+                self.production_plan.to_excel(file_path, index=False, engine='xlsxwriter')
+            elif file_extension.lower() == '.parquet':
+                self.production_plan.to_parquet(file_path, index=False, compression='zstd')
             else:
                 logger.error(f"不支持的导出文件类型: {file_extension}")
                 return False
@@ -3,8 +3,7 @@ import pandas as pd
 import numpy as np
 import os
 import sys
-import matplotlib.pyplot as plt
-import seaborn as sns
+import plotly.express as px
 from datetime import datetime
 
 # 添加项目根目录到路径
@@ -20,6 +19,48 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_data(show_spinner=False)
+def load_shipment_data(file_path, file_mtime):
+    """加载出货数据文件，按文件路径和修改时间缓存，避免每次重跑都重新解析"""
+    return DataProcessor().load_data(file_path)
+
+@st.cache_data(show_spinner=False)
+def process_shipment_data(raw_data):
+    """预处理、月度汇总和物料分析，按原始数据内容缓存"""
+    processor = DataProcessor()
+    processor.raw_data = raw_data
+    processed_data = processor.preprocess_data()
+    monthly_data = processor.aggregate_monthly_data()
+    material_summary = processor.analyze_material_data()
+    
+    if monthly_data is not None:
+        # 物料编号重复度高，转为分类类型以减少内存并加快筛选和分组
+        monthly_data['物料编号'] = monthly_data['物料编号'].astype('category')
+        
+        # 按物料和年月排序一次，后续按物料分组的数据无需再排序
+        monthly_data = monthly_data.sort_values(['物料编号', '年份', '月份'], kind='mergesort', ignore_index=True)
+    
+    return processed_data, monthly_data, material_summary
+
+@st.cache_data(show_spinner=False)
+def summarize_abc(material_summary):
+    """按ABC分类汇总物料数量和出货量"""
+    abc_counts = material_summary['ABC分类'].value_counts()
+    abc_volume = material_summary.groupby('ABC分类')['总出货量'].sum()
+    return abc_counts, abc_volume
+
+def save_uploaded_file(uploaded_file, file_path):
+    """保存上传的文件，内容未变化时不重写，以保持修改时间不变"""
+    file_bytes = uploaded_file.getvalue()
+    
+    if os.path.exists(file_path) and os.path.getsize(file_path) == len(file_bytes):
+        with open(file_path, "rb") as f:
+            if f.read() == file_bytes:
+                return
+    
+    with open(file_path, "wb") as f:
+        f.write(file_bytes)
+
 # 初始化会话状态
 if 'data_processor' not in st.session_state:
     st.session_state.data_processor = DataProcessor()
@@ -50,11 +91,10 @@ if uploaded_file is not None:
     file_path = os.path.join("data", "user_uploads", uploaded_file.name)
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
     
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    save_uploaded_file(uploaded_file, file_path)
     
     # 加载数据
-    st.session_state.raw_data = st.session_state.data_processor.load_data(file_path)
+    st.session_state.raw_data = load_shipment_data(file_path, os.path.getmtime(file_path))
     
     if st.session_state.raw_data is not None:
         st.sidebar.success(f"成功加载数据: {uploaded_file.name}")
@@ -66,7 +106,7 @@ elif use_example_data:
     example_file_path = os.path.join("data", "samples", "example_shipment_data.csv")
     
     if os.path.exists(example_file_path):
-        st.session_state.raw_data = st.session_state.data_processor.load_data(example_file_path)
+        st.session_state.raw_data = load_shipment_data(example_file_path, os.path.getmtime(example_file_path))
         st.sidebar.success("已加载示例数据")
     else:
         st.sidebar.error("示例数据文件不存在")
@@ -89,19 +129,24 @@ elif use_example_data:
 
 # 数据处理按钮
 if st.session_state.raw_data is not None:
+    st.session_state.data_processor.raw_data = st.session_state.raw_data
+    
     if st.sidebar.button("处理数据"):
         # 验证数据
         is_valid, message = st.session_state.data_processor.validate_data()
         
         if is_valid:
-            # 处理数据
-            st.session_state.processed_data = st.session_state.data_processor.preprocess_data()
+            # 处理数据、汇总月度数据并分析物料数据
+            processed_data, monthly_data, material_summary = process_shipment_data(st.session_state.raw_data)
             
-            # 汇总月度数据
-            st.session_state.monthly_data = st.session_state.data_processor.aggregate_monthly_data()
+            st.session_state.processed_data = processed_data
+            st.session_state.monthly_data = monthly_data
+            st.session_state.material_summary = material_summary
             
-            # 分析物料数据
-            st.session_state.material_summary = st.session_state.data_processor.analyze_material_data()
+            # 同步到数据处理器，供季节性分析和导出使用
+            st.session_state.data_processor.processed_data = processed_data
+            st.session_state.data_processor.monthly_data = monthly_data
+            st.session_state.data_processor.material_summary = material_summary
             
             st.sidebar.success("数据处理完成")
         else:
@@ -145,9 +190,8 @@ with tab2:
         
         # 显示处理后的数据分布
         st.subheader("批次数量分布")
-        fig, ax = plt.subplots(figsize=(10, 6))
-        sns.histplot(st.session_state.processed_data['批次数量'], bins=20, ax=ax)
-        st.pyplot(fig)
+        fig = px.histogram(st.session_state.processed_data, x='批次数量', nbins=20)
+        st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("请先处理数据")
 
@@ -167,17 +211,15 @@ with tab3:
         material_data = st.session_state.monthly_data[st.session_state.monthly_data['物料编号'] == selected_material]
         
         # 创建时间序列
-        material_data['日期'] = pd.to_datetime(material_data['年份'].astype(str) + '-' + material_data['月份'].astype(str) + '-01')
+        material_data['日期'] = pd.to_datetime(pd.DataFrame({
+            'year': material_data['年份'], 'month': material_data['月份'], 'day': 1
+        }))
         material_data = material_data.sort_values('日期')
         
         # 绘制趋势图
-        fig, ax = plt.subplots(figsize=(12, 6))
-        ax.plot(material_data['日期'], material_data['批次数量'], marker='o')
-        ax.set_title(f'物料 {selected_material} 月度出货量趋势')
-        ax.set_xlabel('日期')
-        ax.set_ylabel('批次数量')
-        ax.grid(True)
-        st.pyplot(fig)
+        fig = px.line(material_data, x='日期', y='批次数量', markers=True,
+                      title=f'物料 {selected_material} 月度出货量趋势')
+        st.plotly_chart(fig, use_container_width=True)
         
         # 计算季节性
         if len(material_data) >= 12:
@@ -186,14 +228,10 @@ with tab3:
             
             if seasonality is not None:
                 # 绘制季节性指数
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.bar(seasonality['月份'], seasonality['季节性指数'])
-                ax.axhline(y=1.0, color='r', linestyle='-')
-                ax.set_title(f'物料 {selected_material} 季节性指数')
-                ax.set_xlabel('月份')
-                ax.set_ylabel('季节性指数')
-                ax.set_xticks(range(1, 13))
-                st.pyplot(fig)
+                fig = px.bar(seasonality, x='月份', y='季节性指数', title=f'物料 {selected_material} 季节性指数')
+                fig.add_hline(y=1.0, line_color='red')
+                fig.update_xaxes(tickmode='linear', tick0=1, dtick=1)
+                st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("请先处理数据")
 
@@ -205,52 +243,44 @@ with tab4:
         # ABC分析
         st.subheader("ABC分析")
         
-        # 计算各类别的数量
-        abc_counts = st.session_state.material_summary['ABC分类'].value_counts()
+        # 计算各类别的数量和出货量
+        abc_counts, abc_volume = summarize_abc(st.session_state.material_summary)
         
         # 绘制饼图
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
-        
-        # 数量饼图
-        ax1.pie(abc_counts, labels=abc_counts.index, autopct='%1.1f%%', startangle=90)
-        ax1.set_title('物料ABC分类 (按数量)')
+        col1, col2 = st.columns(2)
         
-        # 出货量饼图
-        abc_volume = st.session_state.material_summary.groupby('ABC分类')['总出货量'].sum()
-        ax2.pie(abc_volume, labels=abc_volume.index, autopct='%1.1f%%', startangle=90)
-        ax2.set_title('物料ABC分类 (按出货量)')
+        with col1:
+            # 数量饼图
+            fig = px.pie(values=abc_counts.values, names=abc_counts.index, title='物料ABC分类 (按数量)')
+            st.plotly_chart(fig, use_container_width=True)
         
-        st.pyplot(fig)
+        with col2:
+            # 出货量饼图
+            fig = px.pie(values=abc_volume.values, names=abc_volume.index, title='物料ABC分类 (按出货量)')
+            st.plotly_chart(fig, use_container_width=True)
         
         # 变异系数分析
         st.subheader("需求波动性分析")
         
+        # 只为A类或波动较大的物料添加标签
+        material_summary = st.session_state.material_summary
+        label_mask = (material_summary['ABC分类'] == 'A') | (material_summary['变异系数'] > 1.5)
+        
         # 绘制变异系数散点图
-        fig, ax = plt.subplots(figsize=(12, 8))
-        scatter = ax.scatter(
-            st.session_state.material_summary['月均出货量'], 
-            st.session_state.material_summary['变异系数'],
-            c=st.session_state.material_summary['ABC分类'].map({'A': 0, 'B': 1, 'C': 2}),
-            cmap='viridis',
-            alpha=0.7,
-            s=100
+        fig = px.scatter(
+            material_summary,
+            x='月均出货量',
+            y='变异系数',
+            color='ABC分类',
+            category_orders={'ABC分类': ['A', 'B', 'C']},
+            text=material_summary['物料编号'].where(label_mask, ''),
+            hover_name='物料编号',
+            labels={'变异系数': '变异系数 (CV)'},
+            title='物料需求波动性分析'
         )
+        fig.update_traces(marker=dict(size=12, opacity=0.7), textposition='top center')
         
-        # 添加图例
-        legend1 = ax.legend(scatter.legend_elements()[0], ['A类', 'B类', 'C类'], title="ABC分类")
-        ax.add_artist(legend1)
-        
-        ax.set_xlabel('月均出货量')
-        ax.set_ylabel('变异系数 (CV)')
-        ax.set_title('物料需求波动性分析')
-        ax.grid(True)
-        
-        # 添加物料标签
-        for i, row in st.session_state.material_summary.iterrows():
-            if row['ABC分类'] == 'A' or row['变异系数'] > 1.5:
-                ax.annotate(row['物料编号'], (row['月均出货量'], row['变异系数']))
-        
-        st.pyplot(fig)
+        st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("请先处理数据")
 
@@ -1,11 +1,9 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import os
 import sys
-import matplotlib.pyplot as plt
+import io
 import networkx as nx
-from matplotlib.colors import LinearSegmentedColormap
 
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -20,6 +18,330 @@ st.set_page_config(
     layout="wide"
 )
 
+# 超过该节点数的BOM子图不调用Graphviz，改用按层级排列的布局
+DOT_LAYOUT_MAX_NODES = 60
+
+@st.cache_data(show_spinner=False, persist="disk", max_entries=16)
+def load_bom_file(file_path, file_version):
+    """
+    加载BOM数据文件，结果持久化到磁盘缓存，重新上传同一文件时无需再次解析
+    
+    参数:
+        file_path: BOM数据文件路径
+        file_version: 文件内容或修改时间，仅作为缓存键
+        
+    返回:
+        DataFrame或None: 加载的BOM数据
+    """
+    return BOMManager().load_bom_data(file_path)
+
+@st.cache_data(show_spinner=False, persist="disk", max_entries=16)
+def validate_bom(bom_data):
+    """
+    验证BOM结构，按BOM内容缓存并持久化到磁盘
+    
+    只缓存验证结果和物料类型，BOM管理器和BOM图不写入磁盘，
+    避免模型代码更新后读到旧版本的对象
+    
+    参数:
+        bom_data: BOM数据
+        
+    返回:
+        tuple: (是否有效, 信息, 物料类型字典)
+    """
+    bom_manager = BOMManager()
+    bom_manager.bom_data = bom_data
+    
+    # 验证BOM数据（内部构建BOM图并推断物料类型）
+    is_valid, message = bom_manager.validate_bom_data()
+    
+    return is_valid, message, bom_manager.material_types
+
+def build_validated_bom_manager(bom_data, material_types):
+    """
+    按BOM数据重建BOM管理器和BOM图，并恢复验证时得到的物料类型
+    
+    参数:
+        bom_data: BOM数据
+        material_types: 验证时推断的物料类型字典
+        
+    返回:
+        BOMManager: 完成验证的BOM管理器
+    """
+    bom_manager = BOMManager()
+    bom_manager.bom_data = bom_data
+    bom_manager.build_bom_graph()
+    bom_manager.material_types = dict(material_types)
+    
+    return bom_manager
+
+def get_bom_edges(bom_graph):
+    """
+    获取BOM图的边列表，BOM图对象未变化时复用会话状态中的结果
+    
+    参数:
+        bom_graph: BOM有向图
+        
+    返回:
+        tuple: (父件, 子件, 用量) 组成的边元组，可作为缓存键
+    """
+    cached = st.session_state.get('bom_edges')
+    
+    if cached is None or cached[0] is not bom_graph:
+        edges = tuple(bom_graph.edges(data='quantity'))
+        st.session_state.bom_edges = (bom_graph, edges)
+        return edges
+    
+    return cached[1]
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def build_bom_subgraph(product, bom_edges):
+    """
+    获取成品及其所有下级物料组成的子图，按成品和BOM边缓存
+    
+    参数:
+        product: 成品编号
+        bom_edges: 整个BOM的边元组
+        
+    返回:
+        DiGraph: 该成品的BOM子图
+    """
+    bom_graph = nx.DiGraph()
+    bom_graph.add_weighted_edges_from(bom_edges, weight='quantity')
+    
+    # 成品本身及其所有下级物料，由NetworkX完成遍历；按BFS顺序保留，布局时同一父件的子件相邻
+    related_nodes = [product] + [child for _, child in nx.bfs_edges(bom_graph, product)]
+    
+    subgraph = nx.DiGraph()
+    subgraph.add_nodes_from(related_nodes)
+    subgraph.add_edges_from(bom_graph.edges(related_nodes, data=True))
+    
+    return subgraph
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def compute_bom_layout(product, subgraph_nodes, subgraph_edges):
+    """
+    计算BOM子图的分层布局，按子图的节点和边缓存，避免每次重跑都调用Graphviz
+    
+    参数:
+        product: 成品编号，作为布局的顶层
+        subgraph_nodes: 子图的节点元组
+        subgraph_edges: 子图的边元组
+        
+    返回:
+        dict: 节点 -> 坐标
+    """
+    subgraph = nx.DiGraph()
+    subgraph.add_nodes_from(subgraph_nodes)
+    subgraph.add_edges_from(subgraph_edges)
+    
+    # 小型BOM使用Graphviz的dot布局，未安装pygraphviz时同样使用层级布局
+    if len(subgraph_nodes) <= DOT_LAYOUT_MAX_NODES:
+        try:
+            return nx.nx_agraph.graphviz_layout(subgraph, prog='dot')
+        except ImportError:
+            pass
+    
+    # 按到成品的层级距离分层排列，成品位于顶部；层内保持BFS顺序，同一父件的子件相邻
+    layers = {}
+    for node, level in nx.single_source_shortest_path_length(subgraph, product).items():
+        layers.setdefault(level, []).append(node)
+    pos = nx.multipartite_layout(subgraph, subset_key=layers, align='horizontal')
+    
+    return {node: (x, -y) for node, (x, y) in pos.items()}
+
+def explode_material(material_id, levels, material_type):
+    """
+    展开物料的BOM，BOM图对象未变化时按 (物料, 层级, 类型) 复用会话状态中的结果
+    
+    参数:
+        material_id: 物料编号
+        levels: 展开的层级数
+        material_type: 筛选的物料类型，None表示不筛选
+        
+    返回:
+        DataFrame或None: 展开的BOM
+    """
+    cached = st.session_state.get('exploded_boms')
+    
+    if cached is None or cached[0] is not st.session_state.bom_graph:
+        cached = (st.session_state.bom_graph, {})
+        st.session_state.exploded_boms = cached
+    
+    key = (material_id, levels, material_type)
+    if key not in cached[1]:
+        cached[1][key] = st.session_state.bom_manager.explode_bom(
+            material_id, 
+            levels=levels,
+            material_type=material_type
+        )
+    
+    return cached[1][key]
+
+def figure_to_png(fig):
+    """将图表渲染为PNG字节，缓存中只保存图片数据"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=90, bbox_inches='tight')
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False)
+def build_type_pie(type_counts):
+    """
+    绘制物料类型分布饼图，按各类型数量缓存
+    
+    参数:
+        type_counts: 各物料类型的数量
+        
+    返回:
+        bytes: PNG图片数据
+    """
+    # 绘图库仅在需要绘制图表时导入
+    from matplotlib.figure import Figure
+    
+    fig = Figure(figsize=(8, 8))
+    ax = fig.subplots()
+    ax.pie(type_counts, labels=type_counts.index, autopct='%1.1f%%', startangle=90)
+    ax.set_title('物料类型分布')
+    return figure_to_png(fig)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def build_bom_chart(product, subgraph_nodes, subgraph_edges, node_colors):
+    """
+    绘制成品的BOM结构图，按子图和节点颜色缓存
+    
+    参数:
+        product: 成品编号
+        subgraph_nodes: 子图的节点元组
+        subgraph_edges: 子图的边元组 (父件, 子件, 用量)
+        node_colors: 与节点元组一一对应的颜色
+        
+    返回:
+        bytes: PNG图片数据
+    """
+    import matplotlib.patches as mpatches
+    from matplotlib.figure import Figure
+    
+    subgraph = nx.DiGraph()
+    subgraph.add_nodes_from(subgraph_nodes)
+    subgraph.add_weighted_edges_from(subgraph_edges, weight='quantity')
+    
+    # 使用分层布局
+    pos = compute_bom_layout(product, subgraph_nodes, tuple((u, v) for u, v, _ in subgraph_edges))
+    
+    # 绘制图形
+    fig = Figure(figsize=(12, 8))
+    ax = fig.subplots()
+    
+    # 绘制节点
+    nx.draw_networkx_nodes(subgraph, pos, nodelist=list(subgraph_nodes), node_color=list(node_colors),
+                           node_size=2000, alpha=0.8, ax=ax)
+    
+    # 绘制边
+    nx.draw_networkx_edges(subgraph, pos, edge_color='gray', arrows=True, arrowsize=20, ax=ax)
+    
+    # 绘制标签
+    nx.draw_networkx_labels(subgraph, pos, font_size=10, ax=ax)
+    
+    # 绘制边标签（用量）
+    edge_labels = {(u, v): f"{quantity}" for u, v, quantity in subgraph_edges}
+    nx.draw_networkx_edge_labels(subgraph, pos, edge_labels=edge_labels, font_size=8, ax=ax)
+    
+    # 添加图例
+    legend_elements = [
+        mpatches.Patch(color='lightblue', label='成品'),
+        mpatches.Patch(color='lightgreen', label='半成品'),
+        mpatches.Patch(color='salmon', label='基础原料')
+    ]
+    ax.legend(handles=legend_elements, loc='upper right')
+    
+    # 设置图形边界
+    ax.set_title(f'物料 {product} 的BOM结构')
+    ax.axis('off')
+    
+    return figure_to_png(fig)
+
+@st.cache_data(show_spinner=False)
+def build_type_usage_chart(grouped_data, product):
+    """
+    绘制按物料类型汇总的组件用量柱状图
+    
+    参数:
+        grouped_data: 按物料类型汇总的总用量
+        product: 展开的物料编号
+        
+    返回:
+        bytes: PNG图片数据
+    """
+    from matplotlib.figure import Figure
+    
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.bar(grouped_data['物料类型'], grouped_data['总用量'])
+    ax.set_title(f'物料 {product} 的组件用量 (按类型)')
+    ax.set_xlabel('物料类型')
+    ax.set_ylabel('总用量')
+    return figure_to_png(fig)
+
+@st.cache_data(show_spinner=False)
+def build_top_components_chart(top_materials, product):
+    """
+    绘制用量前10的组件条形图
+    
+    参数:
+        top_materials: 按总用量降序排列的前10个组件
+        product: 展开的物料编号
+        
+    返回:
+        bytes: PNG图片数据
+    """
+    from matplotlib.figure import Figure
+    
+    # 按物料类型为条形图设置颜色
+    bar_colors = None
+    if '物料类型' in top_materials.columns:
+        colors = {'成品': 'lightblue', '半成品': 'lightgreen', '基础原料': 'salmon'}
+        bar_colors = top_materials['物料类型'].map(colors).fillna('gray').tolist()
+    
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    ax.barh(top_materials['组件编号'], top_materials['总用量'], color=bar_colors)
+    
+    ax.set_title(f'物料 {product} 的前10个组件用量')
+    ax.set_xlabel('总用量')
+    ax.set_ylabel('组件编号')
+    
+    # 反转Y轴，使最大值在顶部
+    ax.invert_yaxis()
+    
+    return figure_to_png(fig)
+
+@st.cache_data(show_spinner=False)
+def build_requirement_chart(requirements, title):
+    """
+    绘制物料需求量条形图
+    
+    参数:
+        requirements: 包含物料编号和需求量的数据
+        title: 图表标题
+        
+    返回:
+        bytes: PNG图片数据
+    """
+    from matplotlib.figure import Figure
+    
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    ax.barh(requirements['物料编号'], requirements['需求量'])
+    
+    ax.set_title(title)
+    ax.set_xlabel('需求量')
+    ax.set_ylabel('物料编号')
+    
+    # 反转Y轴，使最大值在顶部
+    ax.invert_yaxis()
+    
+    return figure_to_png(fig)
+
 # 初始化会话状态
 if 'bom_manager' not in st.session_state:
     st.session_state.bom_manager = BOMManager()
@@ -31,6 +353,10 @@ if 'material_types' not in st.session_state:
     st.session_state.material_types = {}
 if 'selected_material' not in st.session_state:
     st.session_state.selected_material = None
+if 'type_counts' not in st.session_state:
+    st.session_state.type_counts = None
+if 'finished_products' not in st.session_state:
+    st.session_state.finished_products = []
 
 # 页面标题
 st.title("物料清单(BOM)管理")
@@ -53,8 +379,8 @@ if uploaded_file is not None:
     with open(file_path, "wb") as f:
         f.write(uploaded_file.getbuffer())
     
-    # 加载数据
-    st.session_state.bom_data = st.session_state.bom_manager.load_bom_data(file_path)
+    # 加载数据（按文件内容缓存）
+    st.session_state.bom_data = load_bom_file(file_path, uploaded_file.getvalue())
     
     if st.session_state.bom_data is not None:
         st.sidebar.success(f"成功加载BOM数据: {uploaded_file.name}")
@@ -66,7 +392,7 @@ elif use_example_data:
     example_file_path = os.path.join("data", "samples", "example_bom_data.csv")
     
     if os.path.exists(example_file_path):
-        st.session_state.bom_data = st.session_state.bom_manager.load_bom_data(example_file_path)
+        st.session_state.bom_data = load_bom_file(example_file_path, os.path.getmtime(example_file_path))
         st.sidebar.success("已加载示例BOM数据")
     else:
         st.sidebar.error("示例BOM数据文件不存在")
@@ -92,12 +418,14 @@ elif use_example_data:
 
 # BOM验证按钮
 if st.session_state.bom_data is not None:
+    st.session_state.bom_manager.bom_data = st.session_state.bom_data
+    
     if st.sidebar.button("验证BOM结构"):
-        # 构建BOM图
-        st.session_state.bom_graph = st.session_state.bom_manager.build_bom_graph()
-        
-        # 验证BOM数据
-        is_valid, message = st.session_state.bom_manager.validate_bom_data()
+        # 验证BOM数据，同一BOM的验证结果从磁盘缓存读取，BOM管理器和BOM图按数据重建
+        is_valid, message, material_types = validate_bom(st.session_state.bom_data)
+        bom_manager = build_validated_bom_manager(st.session_state.bom_data, material_types)
+        st.session_state.bom_graph = bom_manager.bom_graph
+        st.session_state.bom_manager = bom_manager
         
         if is_valid:
             st.sidebar.success("BOM结构验证通过")
@@ -105,9 +433,13 @@ if st.session_state.bom_data is not None:
             # 获取物料类型
             st.session_state.material_types = st.session_state.bom_manager.material_types
             
-            # 获取所有成品
+            # 计算各类型的数量，物料类型只在验证时变化
+            st.session_state.type_counts = pd.Series(st.session_state.material_types).value_counts()
+            
+            # 获取所有成品，保存到会话状态供各标签页复用
             finished_products = [mat_id for mat_id, mat_type in st.session_state.material_types.items() 
                                if mat_type == "成品"]
+            st.session_state.finished_products = finished_products
             
             if finished_products:
                 st.session_state.selected_material = finished_products[0]
@@ -138,14 +470,13 @@ with tab1:
         if st.session_state.material_types:
             st.subheader("物料类型统计")
             
-            # 计算各类型的数量
-            type_counts = pd.Series(st.session_state.material_types).value_counts()
+            # 各类型的数量在验证BOM时已计算
+            type_counts = st.session_state.type_counts
+            if type_counts is None:
+                type_counts = pd.Series(st.session_state.material_types).value_counts()
             
             # 创建饼图
-            fig, ax = plt.subplots(figsize=(8, 8))
-            ax.pie(type_counts, labels=type_counts.index, autopct='%1.1f%%', startangle=90)
-            ax.set_title('物料类型分布')
-            st.pyplot(fig)
+            st.image(build_type_pie(type_counts))
     else:
         st.info("请上传BOM数据或使用示例数据")
 
@@ -153,9 +484,8 @@ with tab2:
     if st.session_state.bom_graph is not None:
         st.subheader("BOM结构可视化")
         
-        # 获取所有成品
-        finished_products = [mat_id for mat_id, mat_type in st.session_state.material_types.items() 
-                           if mat_type == "成品"]
+        # 获取所有成品（验证BOM时已计算）
+        finished_products = st.session_state.finished_products
         
         # 选择要显示的成品
         selected_product = st.selectbox("选择成品", finished_products, 
@@ -165,28 +495,13 @@ with tab2:
         # 更新选中的物料
         st.session_state.selected_material = selected_product
         
-        # 创建子图
-        subgraph = nx.DiGraph()
-        
-        # 使用BFS遍历获取所有相关节点和边
-        nodes_to_visit = [selected_product]
-        visited = set()
-        
-        while nodes_to_visit:
-            current = nodes_to_visit.pop(0)
-            if current in visited:
-                continue
-                
-            visited.add(current)
-            
-            # 获取子件
-            for _, child, data in st.session_state.bom_graph.out_edges(current, data=True):
-                subgraph.add_edge(current, child, **data)
-                nodes_to_visit.append(child)
+        # 获取该成品的BOM子图（按成品和BOM边缓存）
+        subgraph = build_bom_subgraph(selected_product, get_bom_edges(st.session_state.bom_graph))
         
         # 设置节点颜色
+        subgraph_nodes = tuple(subgraph.nodes())
         node_colors = []
-        for node in subgraph.nodes():
+        for node in subgraph_nodes:
             if node in st.session_state.material_types:
                 if st.session_state.material_types[node] == "成品":
                     node_colors.append('lightblue')
@@ -197,40 +512,10 @@ with tab2:
             else:
                 node_colors.append('gray')
         
-        # 绘制图形
-        fig, ax = plt.subplots(figsize=(12, 8))
-        
-        # 使用分层布局
-        pos = nx.nx_agraph.graphviz_layout(subgraph, prog='dot')
-        
-        # 绘制节点
-        nx.draw_networkx_nodes(subgraph, pos, node_color=node_colors, node_size=2000, alpha=0.8)
-        
-        # 绘制边
-        nx.draw_networkx_edges(subgraph, pos, edge_color='gray', arrows=True, arrowsize=20)
-        
-        # 绘制标签
-        nx.draw_networkx_labels(subgraph, pos, font_size=10)
-        
-        # 绘制边标签（用量）
-        edge_labels = {(u, v): f"{d['quantity']}" for u, v, d in subgraph.edges(data=True)}
-        nx.draw_networkx_edge_labels(subgraph, pos, edge_labels=edge_labels, font_size=8)
-        
-        # 添加图例
-        import matplotlib.patches as mpatches
-        legend_elements = [
-            mpatches.Patch(color='lightblue', label='成品'),
-            mpatches.Patch(color='lightgreen', label='半成品'),
-            mpatches.Patch(color='salmon', label='基础原料')
-        ]
-        ax.legend(handles=legend_elements, loc='upper right')
-        
-        # 设置图形边界
-        ax.set_title(f'物料 {selected_product} 的BOM结构')
-        ax.axis('off')
-        
-        # 显示图形
-        st.pyplot(fig)
+        # 绘制图形（按子图和节点颜色缓存）
+        st.image(build_bom_chart(
+            selected_product, subgraph_nodes, tuple(subgraph.edges(data='quantity')), tuple(node_colors)
+        ))
         
         # 显示物料信息
         if selected_product in st.session_state.material_types:
@@ -260,12 +545,8 @@ with tab3:
         if selected_type != "全部":
             filter_type = selected_type
         
-        # 展开BOM
-        exploded_bom = st.session_state.bom_manager.explode_bom(
-            st.session_state.selected_material, 
-            levels=levels,
-            material_type=filter_type
-        )
+        # 展开BOM（同一BOM下按物料、层级和类型缓存）
+        exploded_bom = explode_material(st.session_state.selected_material, levels, filter_type)
         
         if exploded_bom is not None and not exploded_bom.empty:
             st.dataframe(exploded_bom)
@@ -277,33 +558,12 @@ with tab3:
             if '物料类型' in exploded_bom.columns:
                 grouped_data = exploded_bom.groupby('物料类型')['总用量'].sum().reset_index()
                 
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.bar(grouped_data['物料类型'], grouped_data['总用量'])
-                ax.set_title(f'物料 {st.session_state.selected_material} 的组件用量 (按类型)')
-                ax.set_xlabel('物料类型')
-                ax.set_ylabel('总用量')
-                st.pyplot(fig)
+                st.image(build_type_usage_chart(grouped_data, st.session_state.selected_material))
             
             # 创建用量前10的物料图表
             top_materials = exploded_bom.sort_values('总用量', ascending=False).head(10)
             
-            fig, ax = plt.subplots(figsize=(12, 6))
-            bars = ax.barh(top_materials['组件编号'], top_materials['总用量'])
-            
-            # 为条形图添加颜色
-            if '物料类型' in top_materials.columns:
-                colors = {'成品': 'lightblue', '半成品': 'lightgreen', '基础原料': 'salmon'}
-                for i, bar in enumerate(bars):
-                    bar.set_color(colors.get(top_materials.iloc[i]['物料类型'], 'gray'))
-            
-            ax.set_title(f'物料 {st.session_state.selected_material} 的前10个组件用量')
-            ax.set_xlabel('总用量')
-            ax.set_ylabel('组件编号')
-            
-            # 反转Y轴，使最大值在顶部
-            ax.invert_yaxis()
-            
-            st.pyplot(fig)
+            st.image(build_top_components_chart(top_materials, st.session_state.selected_material))
         else:
             st.info(f"物料 {st.session_state.selected_material} 没有符合条件的子组件")
     else:
@@ -316,9 +576,8 @@ with tab4:
         # 创建简单的生产计划输入
         st.write("输入生产计划数量:")
         
-        # 获取所有成品
-        finished_products = [mat_id for mat_id, mat_type in st.session_state.material_types.items() 
-                           if mat_type == "成品"]
+        # 获取所有成品（验证BOM时已计算）
+        finished_products = st.session_state.finished_products
         
         # 创建输入表单
         with st.form("production_plan_form"):
@@ -354,17 +613,7 @@ with tab4:
                 st.dataframe(raw_requirements)
                 
                 # 创建原材料需求图表
-                fig, ax = plt.subplots(figsize=(12, 6))
-                bars = ax.barh(raw_requirements['物料编号'], raw_requirements['需求量'])
-                
-                ax.set_title('基础原料需求量')
-                ax.set_xlabel('需求量')
-                ax.set_ylabel('物料编号')
-                
-                # 反转Y轴，使最大值在顶部
-                ax.invert_yaxis()
-                
-                st.pyplot(fig)
+                st.image(build_requirement_chart(raw_requirements, '基础原料需求量'))
             else:
                 st.info("未计算出任何基础原料需求")
             
@@ -376,17 +625,7 @@ with tab4:
                 st.dataframe(semifinished_requirements)
                 
                 # 创建半成品需求图表
-                fig, ax = plt.subplots(figsize=(12, 6))
-                bars = ax.barh(semifinished_requirements['物料编号'], semifinished_requirements['需求量'])
-                
-                ax.set_title('半成品需求量')
-                ax.set_xlabel('需求量')
-                ax.set_ylabel('物料编号')
-                
-                # 反转Y轴，使最大值在顶部
-                ax.invert_yaxis()
-                
-                st.pyplot(fig)
+                st.image(build_requirement_chart(semifinished_requirements, '半成品需求量'))
             else:
                 st.info("未计算出任何半成品需求")
     else:
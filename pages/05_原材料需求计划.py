@@ -1,21 +1,36 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+import plotly.graph_objects as go
 import os
 import sys
-from datetime import datetime
+import time
 import io
+from pandas.util import hash_pandas_object
 
 # 添加路径以导入自定义模块
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from models.forecaster import Forecaster
-from models.data_processor import DataProcessor
 from models.production_planner import ProductionPlanner
 from models.bom_manager import BOMManager
 from models.mrp_calculator import MRPCalculator
 
+# calamine（Rust实现）解析Excel更快，未安装时使用pandas默认引擎
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = None
+
+# pyarrow可多线程解析CSV，并以Arrow列存储数据，编号等字符串列占用更少内存；未安装时使用pandas默认实现
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 上传文件支持的格式，Parquet按列存储且保留类型，读取远快于Excel
+UPLOAD_FILE_TYPES = ['csv', 'xlsx', 'xls', 'parquet']
+
 # 页面配置
 st.set_page_config(
     page_title="原材料需求计划 - 生产需求系统",
@@ -23,36 +38,250 @@ st.set_page_config(
     layout="wide"
 )
 
-# 初始化会话状态
-if 'data_processor' not in st.session_state:
-    st.session_state.data_processor = DataProcessor()
+@st.cache_data(show_spinner=False)
+def load_uploaded_table(file_name, file_bytes, shrink=True):
+    """解析上传的CSV、Parquet或Excel文件并按需压缩数据类型，按文件名、内容和是否压缩缓存，避免每次重跑都重新解析"""
+    suffix = file_name.rsplit('.', 1)[-1].lower()
+    buffer = io.BytesIO(file_bytes)
+    
+    # 安装了pyarrow时直接读取为Arrow类型的DataFrame
+    arrow_kwargs = {'dtype_backend': 'pyarrow'} if PYARROW_AVAILABLE else {}
+    
+    if suffix == 'csv':
+        if PYARROW_AVAILABLE:
+            data = pd.read_csv(buffer, engine='pyarrow', **arrow_kwargs)
+        else:
+            data = pd.read_csv(buffer)
+    elif suffix == 'parquet':
+        data = pd.read_parquet(buffer, **arrow_kwargs)
+    else:
+        data = pd.read_excel(buffer, engine=EXCEL_ENGINE, **arrow_kwargs)
+    
+    return shrink_dtypes(data) if shrink else data
 
-if 'forecaster' not in st.session_state:
-    st.session_state.forecaster = Forecaster()
+def upload_table(label, data_name, required_fields, shrink=True):
+    """
+    显示文件上传控件，解析上传的文件、显示预览并检查必要字段
+    
+    参数:
+        label: 上传控件的标签
+        data_name: 数据名称，用于提示信息
+        required_fields: 必要字段列表
+        shrink: 是否压缩数据类型
+        
+    返回:
+        DataFrame或None: 上传的数据，未上传文件、解析失败或缺少必要字段时返回None
+    """
+    uploaded_file = st.file_uploader(label, type=UPLOAD_FILE_TYPES)
+    
+    if uploaded_file is None:
+        return None
+    
+    try:
+        data = load_uploaded_table(uploaded_file.name, uploaded_file.getvalue(), shrink)
+    except Exception as e:
+        st.error(f"处理{data_name}文件时出错: {str(e)}")
+        return None
+    
+    st.success(f"{data_name}上传成功，包含 {len(data)} 条记录")
+    
+    # 显示数据预览
+    st.write(f"{data_name}预览：")
+    st.dataframe(data.head())
+    
+    # 检查必要字段
+    missing_fields = [field for field in required_fields if field not in data.columns]
+    
+    if missing_fields:
+        st.error(f"{data_name}缺少必要字段: {', '.join(missing_fields)}")
+        return None
+    
+    return data
 
-if 'production_planner' not in st.session_state:
-    st.session_state.production_planner = ProductionPlanner()
+def shrink_dtypes(data):
+    """
+    压缩数值列和低基数文本列的数据类型，减少会话状态和缓存占用的内存
+    
+    参数:
+        data: 上传或计算得到的DataFrame
+        
+    返回:
+        DataFrame: 压缩类型后的新DataFrame，未修改的列与原数据共享
+    """
+    converted = {}
+    
+    for column in data.select_dtypes(include='integer').columns:
+        converted[column] = pd.to_numeric(data[column], downcast='integer')
+    
+    # 浮点列只在转为float32不损失精度时压缩，避免改变需求量和成本的计算结果
+    for column in data.select_dtypes(include='floating').columns:
+        values = data[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        if np.array_equal(values.astype(np.float32), values, equal_nan=True):
+            converted[column] = pd.to_numeric(data[column], downcast='float')
+    
+    # 编号等重复度高的文本列转为分类类型
+    for column in data.select_dtypes(include=['object', 'string']).columns:
+        if data[column].nunique() < 0.5 * len(data):
+            converted[column] = data[column].astype('category')
+    
+    return data.assign(**converted) if converted else data
 
-if 'bom_manager' not in st.session_state:
-    st.session_state.bom_manager = BOMManager()
+@st.cache_data(show_spinner=False)
+def build_bom_manager(bom_data):
+    """
+    构建BOM图、推断物料类型并验证层级结构，按BOM内容缓存
+    
+    参数:
+        bom_data: BOM数据
+    
+    返回:
+        tuple: (完成构建的BOM管理器, 是否有效, 信息)
+    """
+    bom_manager = BOMManager()
+    bom_manager.bom_data = bom_data
+    bom_manager.build_bom_graph()
+    bom_manager.infer_material_types()
+    
+    is_valid, message = bom_manager.validate_hierarchy()
+    
+    return bom_manager, is_valid, message
 
-if 'mrp_calculator' not in st.session_state:
-    st.session_state.mrp_calculator = MRPCalculator(st.session_state.bom_manager)
+@st.cache_data(show_spinner=False)
+def run_mrp(production_plan, bom_data, raw_inventory, semifinished_inventory, supplier_data, mrp_parameters, _bom_manager):
+    """
+    计算物料需求、采购计划和半成品生产计划，按输入数据和参数缓存
+    
+    参数:
+        production_plan: 生产计划
+        bom_data: BOM数据，作为BOM管理器的缓存键
+        raw_inventory: 原材料库存，没有时为None
+        semifinished_inventory: 半成品库存，没有时为None
+        supplier_data: 供应商数据，没有时为None
+        mrp_parameters: MRP参数
+        _bom_manager: 已构建BOM图的BOM管理器，不参与缓存键计算
+    
+    返回:
+        tuple: (原材料需求, 半成品需求, 采购计划, 半成品生产计划)，失败的步骤及其后续步骤为None
+    """
+    calculator = MRPCalculator(_bom_manager)
+    calculator.load_production_plan(production_plan)
+    calculator.raw_material_inventory = raw_inventory
+    calculator.semifinished_inventory = semifinished_inventory
+    calculator.supplier_data = supplier_data
+    calculator.mrp_parameters = mrp_parameters
+    
+    raw_requirements, semifinished_requirements = calculator.calculate_requirements()
+    
+    if raw_requirements is None or semifinished_requirements is None:
+        return None, None, None, None
+    
+    purchase_plan = calculator.optimize_purchase_plan()
+    
+    if purchase_plan is None:
+        return raw_requirements, semifinished_requirements, None, None
+    
+    semifinished_plan = calculator.generate_semifinished_production_plan()
+    
+    return raw_requirements, semifinished_requirements, purchase_plan, semifinished_plan
+
+@st.cache_data(show_spinner=False)
+def get_top_requirements(requirements, n=8):
+    """取需求量最大的前n种物料，按需求数据缓存，切换标签页时无需重新排序"""
+    return requirements.nlargest(n, '需求量')
+
+@st.cache_data(show_spinner=False)
+def summarize_monthly_purchase(purchase_plan):
+    """
+    按月份汇总采购量和成本，按采购计划缓存
+    
+    参数:
+        purchase_plan: 采购计划
+        
+    返回:
+        tuple: (年月标签数组, 采购量数组, 成本数组)
+    """
+    monthly_purchase = purchase_plan.groupby(['年份', '月份'], observed=True)[['计划采购量', '预计成本']].sum().reset_index()
+    
+    # 整列拼接年月标签，不逐行构造
+    monthly_labels = (monthly_purchase['年份'].astype(str) + '-' + monthly_purchase['月份'].astype(str)).to_numpy()
+    
+    return monthly_labels, monthly_purchase['计划采购量'].to_numpy(), monthly_purchase['预计成本'].to_numpy()
 
-if 'production_plan' not in st.session_state:
-    st.session_state.production_plan = None
+def hash_mrp_inputs(production_plan, bom_data, raw_inventory, semifinished_inventory, supplier_data, mrp_parameters):
+    """
+    计算MRP输入数据和参数的摘要，用于判断已有计算结果是否仍是最新
+    
+    参数:
+        production_plan: 生产计划
+        bom_data: BOM数据
+        raw_inventory: 原材料库存，没有时为None
+        semifinished_inventory: 半成品库存，没有时为None
+        supplier_data: 供应商数据，没有时为None
+        mrp_parameters: MRP参数
+        
+    返回:
+        int: 输入摘要
+    """
+    digest = [tuple(sorted(mrp_parameters.items()))]
+    
+    for data in (production_plan, bom_data, raw_inventory, semifinished_inventory, supplier_data):
+        if data is None:
+            digest.append(None)
+        else:
+            digest.append((tuple(data.columns), int(hash_pandas_object(data).sum())))
+    
+    return hash(tuple(digest))
 
-if 'bom_data' not in st.session_state:
-    st.session_state.bom_data = None
+def get_raw_materials(bom_data):
+    """
+    获取BOM中的基础原料（从不作为父件出现的子件），BOM数据对象未变化时复用会话状态中的结果
+    
+    参数:
+        bom_data: BOM数据
+        
+    返回:
+        Index: 基础原料编号
+    """
+    cached = st.session_state.get('raw_materials')
+    
+    if cached is None or cached[0] is not bom_data:
+        raw_materials = pd.Index(bom_data['子件编号'].unique()).difference(bom_data['成品编号'].unique())
+        st.session_state.raw_materials = (bom_data, raw_materials)
+        return raw_materials
+    
+    return cached[1]
 
-if 'raw_material_requirements' not in st.session_state:
-    st.session_state.raw_material_requirements = None
+def build_top_requirements_chart(top_requirements, title):
+    """
+    绘制需求量最大物料的柱状图，由浏览器端渲染，无需在服务端生成图片
+    
+    参数:
+        top_requirements: 需求量最大的物料
+        title: 图表标题
+        
+    返回:
+        plotly Figure: 物料需求柱状图
+    """
+    fig = go.Figure(go.Bar(x=top_requirements['物料编号'].to_numpy(), y=top_requirements['需求量'].to_numpy()))
+    fig.update_layout(title=title, xaxis_title='物料编号', yaxis_title='需求量', xaxis_type='category', xaxis_tickangle=-45)
+    return fig
 
-if 'semifinished_requirements' not in st.session_state:
-    st.session_state.semifinished_requirements = None
+# 初始化会话状态，默认值以工厂函数给出，只在首次访问时创建对象；
+# 本页不使用数据处理器和预测器，不再为其创建实例
+session_defaults = {
+    'production_planner': ProductionPlanner,
+    'bom_manager': BOMManager,
+    'mrp_calculator': lambda: MRPCalculator(st.session_state.bom_manager),
+    'production_plan': lambda: None,
+    'bom_data': lambda: None,
+    'raw_material_requirements': lambda: None,
+    'semifinished_requirements': lambda: None,
+    'purchase_plan': lambda: None
+}
 
-if 'purchase_plan' not in st.session_state:
-    st.session_state.purchase_plan = None
+for key, default_factory in session_defaults.items():
+    if key not in st.session_state:
+        st.session_state[key] = default_factory()
 
 # 页面标题
 st.title("原材料需求计划(MRP)")
@@ -97,35 +326,15 @@ with tab1:
             # 提供上传生产计划功能
             st.write("或上传已有的生产计划数据")
             
-            plan_file = st.file_uploader("选择生产计划文件", type=['csv', 'xlsx', 'xls'])
+            # 生产计划会共享给生产计划页面并在原数据上调整，不压缩类型，避免调整后的产量和库存超出小整数类型的范围
+            plan_data = upload_table("选择生产计划文件", "生产计划", ['年份', '月份', '物料编号', '计划产量'], shrink=False)
             
-            if plan_file is not None:
-                try:
-                    if plan_file.name.endswith('.csv'):
-                        plan_data = pd.read_csv(plan_file)
-                    else:
-                        plan_data = pd.read_excel(plan_file)
-                    
-                    st.success(f"生产计划上传成功，包含 {len(plan_data)} 条记录")
-                    
-                    # 显示数据预览
-                    st.write("生产计划预览：")
-                    st.dataframe(plan_data.head())
-                    
-                    # 检查必要字段
-                    required_fields = ['年份', '月份', '物料编号', '计划产量']
-                    missing_fields = [field for field in required_fields if field not in plan_data.columns]
-                    
-                    if missing_fields:
-                        st.error(f"计划数据缺少必要字段: {', '.join(missing_fields)}")
-                    else:
-                        # 保存到会话状态
-                        st.session_state.production_plan = plan_data
-                        
-                        # 加载到生产计划器
-                        st.session_state.production_planner.production_plan = plan_data
-                except Exception as e:
-                    st.error(f"处理计划文件时出错: {str(e)}")
+            if plan_data is not None:
+                # 保存到会话状态
+                st.session_state.production_plan = plan_data
+                
+                # 加载到生产计划器
+                st.session_state.production_planner.production_plan = plan_data
     
     with col2:
         st.write("### 物料清单(BOM)数据")
@@ -140,49 +349,20 @@ with tab1:
         else:
             st.write("请上传物料清单(BOM)数据")
             
-            bom_file = st.file_uploader("选择BOM文件", type=['csv', 'xlsx', 'xls'])
+            bom_data = upload_table("选择BOM文件", "BOM数据", ['成品编号', '子件编号', '单位用量'])
             
-            if bom_file is not None:
-                try:
-                    if bom_file.name.endswith('.csv'):
-                        bom_data = pd.read_csv(bom_file)
-                    else:
-                        bom_data = pd.read_excel(bom_file)
-                    
-                    st.success(f"BOM数据上传成功，包含 {len(bom_data)} 条记录")
-                    
-                    # 显示数据预览
-                    st.write("BOM数据预览：")
-                    st.dataframe(bom_data.head())
-                    
-                    # 检查必要字段
-                    required_fields = ['成品编号', '子件编号', '单位用量']
-                    missing_fields = [field for field in required_fields if field not in bom_data.columns]
-                    
-                    if missing_fields:
-                        st.error(f"BOM数据缺少必要字段: {', '.join(missing_fields)}")
-                    else:
-                        # 保存到会话状态
-                        st.session_state.bom_data = bom_data
-                        
-                        # 加载到BOM管理器
-                        st.session_state.bom_manager.load_bom_data(bom_data)
-                        
-                        # 构建BOM图
-                        st.session_state.bom_manager.build_bom_graph()
-                        
-                        # 推断物料类型
-                        st.session_state.bom_manager.infer_material_types()
-                        
-                        # 验证BOM结构
-                        is_valid, message = st.session_state.bom_manager.validate_hierarchy()
-                        
-                        if is_valid:
-                            st.success(message)
-                        else:
-                            st.warning(message)
-                except Exception as e:
-                    st.error(f"处理BOM文件时出错: {str(e)}")
+            if bom_data is not None:
+                # 保存到会话状态
+                st.session_state.bom_data = bom_data
+                
+                # 构建BOM图、推断物料类型并验证BOM结构
+                bom_manager, is_valid, message = build_bom_manager(bom_data)
+                st.session_state.bom_manager = bom_manager
+                
+                if is_valid:
+                    st.success(message)
+                else:
+                    st.warning(message)
     
     # 库存数据
     st.write("### 原材料库存数据（可选）")
@@ -193,59 +373,27 @@ with tab1:
     )
     
     if inventory_source == "上传库存文件":
-        raw_inventory_file = st.file_uploader("选择原材料库存数据文件", type=['csv', 'xlsx', 'xls'])
+        raw_inventory = upload_table("选择原材料库存数据文件", "原材料库存数据", ['物料编号', '库存数量'])
         
-        if raw_inventory_file is not None:
-            try:
-                if raw_inventory_file.name.endswith('.csv'):
-                    raw_inventory = pd.read_csv(raw_inventory_file)
-                else:
-                    raw_inventory = pd.read_excel(raw_inventory_file)
-                
-                st.success(f"原材料库存数据上传成功，包含 {len(raw_inventory)} 条记录")
-                
-                # 显示数据预览
-                st.write("原材料库存数据预览：")
-                st.dataframe(raw_inventory.head())
-                
-                # 检查必要字段
-                required_fields = ['物料编号', '库存数量']
-                missing_fields = [field for field in required_fields if field not in raw_inventory.columns]
-                
-                if missing_fields:
-                    st.error(f"库存数据缺少必要字段: {', '.join(missing_fields)}")
-                else:
-                    # 保存到会话状态并加载到MRP计算器
-                    st.session_state.raw_material_inventory = raw_inventory
-                    st.session_state.mrp_calculator.load_raw_material_inventory(raw_inventory)
-            except Exception as e:
-                st.error(f"处理库存文件时出错: {str(e)}")
+        if raw_inventory is not None:
+            # 保存到会话状态并加载到MRP计算器
+            st.session_state.raw_material_inventory = raw_inventory
+            st.session_state.mrp_calculator.load_raw_material_inventory(raw_inventory)
     
     elif inventory_source == "手动输入":
         st.write("请手动输入原材料库存数据")
         
         # 只有在有BOM数据时才允许手动输入库存
         if 'bom_data' in st.session_state and st.session_state.bom_data is not None:
-            # 尝试获取基础原料清单
-            raw_materials = set()
-            
-            for _, row in st.session_state.bom_data.iterrows():
-                child_id = row['子件编号']
-                # 检查此物料是否是基础原料（没有子件）
-                is_raw = True
-                for _, r in st.session_state.bom_data.iterrows():
-                    if r['成品编号'] == child_id:
-                        is_raw = False
-                        break
-                if is_raw:
-                    raw_materials.add(child_id)
+            # 获取基础原料清单
+            raw_materials = get_raw_materials(st.session_state.bom_data)
             
             # 创建一个DataFrame用于编辑
             if 'manual_raw_inventory' not in st.session_state:
                 # 初始化为所有物料的库存为0
                 st.session_state.manual_raw_inventory = pd.DataFrame({
-                    '物料编号': list(raw_materials),
-                    '库存数量': np.zeros(len(raw_materials))
+                    '物料编号': raw_materials,
+                    '库存数量': 0.0
                 })
             
             # 显示编辑表
@@ -273,36 +421,15 @@ with tab1:
     )
     
     if supplier_source == "上传供应商文件":
-        supplier_file = st.file_uploader("选择供应商数据文件", type=['csv', 'xlsx', 'xls'])
+        supplier_data = upload_table("选择供应商数据文件", "供应商数据", ['物料编号', '供应商编号'])
         
-        if supplier_file is not None:
-            try:
-                if supplier_file.name.endswith('.csv'):
-                    supplier_data = pd.read_csv(supplier_file)
-                else:
-                    supplier_data = pd.read_excel(supplier_file)
-                
-                st.success(f"供应商数据上传成功，包含 {len(supplier_data)} 条记录")
-                
-                # 显示数据预览
-                st.write("供应商数据预览：")
-                st.dataframe(supplier_data.head())
-                
-                # 检查必要字段
-                required_fields = ['物料编号', '供应商编号']
-                missing_fields = [field for field in required_fields if field not in supplier_data.columns]
-                
-                if missing_fields:
-                    st.error(f"供应商数据缺少必要字段: {', '.join(missing_fields)}")
-                else:
-                    # 保存到会话状态和BOM管理器
-                    st.session_state.supplier_data = supplier_data
-                    st.session_state.bom_manager.load_supplier_data(supplier_data)
-                    
-                    # 加载到MRP计算器
-                    st.session_state.mrp_calculator.load_supplier_data(supplier_data)
-            except Exception as e:
-                st.error(f"处理供应商文件时出错: {str(e)}")
+        if supplier_data is not None:
+            # 保存到会话状态和BOM管理器
+            st.session_state.supplier_data = supplier_data
+            st.session_state.bom_manager.load_supplier_data(supplier_data)
+            
+            # 加载到MRP计算器
+            st.session_state.mrp_calculator.load_supplier_data(supplier_data)
     
     elif supplier_source == "使用默认供应商设置":
         st.write("使用默认供应商参数")
@@ -319,34 +446,17 @@ with tab1:
         if st.button("应用默认供应商设置"):
             # 只有在有BOM数据时才应用
             if 'bom_data' in st.session_state and st.session_state.bom_data is not None:
-                # 尝试获取基础原料清单
-                raw_materials = set()
-                
-                for _, row in st.session_state.bom_data.iterrows():
-                    child_id = row['子件编号']
-                    # 检查此物料是否是基础原料（没有子件）
-                    is_raw = True
-                    for _, r in st.session_state.bom_data.iterrows():
-                        if r['成品编号'] == child_id:
-                            is_raw = False
-                            break
-                    if is_raw:
-                        raw_materials.add(child_id)
-                
-                # 创建默认供应商数据
-                default_suppliers = []
+                # 获取基础原料清单
+                raw_materials = get_raw_materials(st.session_state.bom_data)
                 
-                for material in raw_materials:
-                    default_suppliers.append({
-                        '物料编号': material,
-                        '供应商编号': 'DEFAULT_SUPPLIER',
-                        '单价': default_price,
-                        '最小订购量': default_min_order,
-                        '采购提前期': default_lead_time
-                    })
-                
-                # 创建DataFrame
-                supplier_df = pd.DataFrame(default_suppliers)
+                # 创建默认供应商数据，标量参数按列广播
+                supplier_df = pd.DataFrame({
+                    '物料编号': raw_materials,
+                    '供应商编号': 'DEFAULT_SUPPLIER',
+                    '单价': default_price,
+                    '最小订购量': default_min_order,
+                    '采购提前期': default_lead_time
+                })
                 
                 # 保存到会话状态和加载到MRP计算器
                 st.session_state.supplier_data = supplier_df
@@ -442,36 +552,65 @@ with tab3:
             st.write("### 计算MRP")
             
             # 添加计算按钮
-            if st.button("​计算原材料需求​"):
+            calculate_clicked = st.button("​计算原材料需求​")
+            
+            if calculate_clicked:
+                mrp_calculator = st.session_state.mrp_calculator
+                mrp_input_hash = hash_mrp_inputs(
+                    st.session_state.production_plan,
+                    st.session_state.bom_data,
+                    mrp_calculator.raw_material_inventory,
+                    mrp_calculator.semifinished_inventory,
+                    mrp_calculator.supplier_data,
+                    mrp_calculator.mrp_parameters
+                )
+            
+            # 输入数据和参数与上次成功计算时相同，直接保留已有结果
+            if calculate_clicked and mrp_input_hash == st.session_state.get('mrp_input_hash') and st.session_state.purchase_plan is not None:
+                st.info("结果已是最新，跳过重复计算")
+            elif calculate_clicked:
                 with st.spinner("正在计算原材料需求，请稍候..."):
                     try:
                         # 准备数据
                         # 1. 设置BOM管理器引用
-                        st.session_state.mrp_calculator.set_bom_manager(st.session_state.bom_manager)
+                        mrp_calculator.set_bom_manager(st.session_state.bom_manager)
                         
                         # 2. 加载生产计划
-                        st.session_state.mrp_calculator.load_production_plan(st.session_state.production_plan)
+                        mrp_calculator.load_production_plan(st.session_state.production_plan)
                         
-                        # 3. 计算需求
-                        raw_requirements, semifinished_requirements = st.session_state.mrp_calculator.calculate_requirements()
+                        # 3. 计算需求、采购计划和半成品生产计划，输入未变化时直接复用缓存结果
+                        raw_requirements, semifinished_requirements, purchase_plan, semifinished_plan = run_mrp(
+                            mrp_calculator.production_plan,
+                            st.session_state.bom_data,
+                            mrp_calculator.raw_material_inventory,
+                            mrp_calculator.semifinished_inventory,
+                            mrp_calculator.supplier_data,
+                            mrp_calculator.mrp_parameters,
+                            st.session_state.bom_manager
+                        )
                         
                         if raw_requirements is not None and semifinished_requirements is not None:
-                            # 保存计算结果
+                            # 压缩数据类型后保存计算结果，同步到MRP计算器供报告导出使用
+                            raw_requirements = shrink_dtypes(raw_requirements)
+                            semifinished_requirements = shrink_dtypes(semifinished_requirements)
                             st.session_state.raw_material_requirements = raw_requirements
                             st.session_state.semifinished_requirements = semifinished_requirements
+                            mrp_calculator.raw_material_requirements = raw_requirements
+                            mrp_calculator.semifinished_requirements = semifinished_requirements
                             
                             st.success(f"需求计算成功，发现 {len(raw_requirements)} 种原材料和 {len(semifinished_requirements)} 种半成品")
                             
                             # 继续计算采购计划
-                            if st.session_state.mrp_calculator.optimize_purchase_plan() is not None:
-                                st.session_state.purchase_plan = st.session_state.mrp_calculator.purchase_plan
+                            if purchase_plan is not None:
+                                purchase_plan = shrink_dtypes(purchase_plan)
+                                st.session_state.purchase_plan = purchase_plan
+                                mrp_calculator.purchase_plan = purchase_plan
+                                st.session_state.mrp_input_hash = mrp_input_hash
                                 st.success("采购计划优化成功")
                                 
                                 # 继续计算半成品生产计划
-                                semifinished_plan = st.session_state.mrp_calculator.generate_semifinished_production_plan()
-                                
                                 if semifinished_plan is not None:
-                                    st.session_state.semifinished_plan = semifinished_plan
+                                    st.session_state.semifinished_plan = shrink_dtypes(semifinished_plan)
                                     st.success("半成品生产计划生成成功")
                                 else:
                                     st.warning("半成品生产计划生成失败")
@@ -501,17 +640,10 @@ with tab3:
                     # 可视化
                     if len(st.session_state.raw_material_requirements) > 0:
                         # 取需求量最大的前8种原材料
-                        top_materials = st.session_state.raw_material_requirements.nlargest(8, '需求量')
-                        
-                        fig, ax = plt.subplots(figsize=(10, 6))
-                        ax.bar(top_materials['物料编号'], top_materials['需求量'])
-                        ax.set_title('需求量最大的原材料')
-                        ax.set_xlabel('物料编号')
-                        ax.set_ylabel('需求量')
-                        plt.xticks(rotation=45)
-                        plt.tight_layout()
+                        top_materials = get_top_requirements(st.session_state.raw_material_requirements)
                         
-                        st.pyplot(fig)
+                        fig = build_top_requirements_chart(top_materials, '需求量最大的原材料')
+                        st.plotly_chart(fig, use_container_width=True)
                 
                 with result_tab2:
                     if 'semifinished_requirements' in st.session_state and st.session_state.semifinished_requirements is not None:
@@ -523,17 +655,10 @@ with tab3:
                         # 可视化
                         if len(st.session_state.semifinished_requirements) > 0:
                             # 取需求量最大的前8种半成品
-                            top_semifinished = st.session_state.semifinished_requirements.nlargest(8, '需求量')
-                            
-                            fig, ax = plt.subplots(figsize=(10, 6))
-                            ax.bar(top_semifinished['物料编号'], top_semifinished['需求量'])
-                            ax.set_title('需求量最大的半成品')
-                            ax.set_xlabel('物料编号')
-                            ax.set_ylabel('需求量')
-                            plt.xticks(rotation=45)
-                            plt.tight_layout()
+                            top_semifinished = get_top_requirements(st.session_state.semifinished_requirements)
                             
-                            st.pyplot(fig)
+                            fig = build_top_requirements_chart(top_semifinished, '需求量最大的半成品')
+                            st.plotly_chart(fig, use_container_width=True)
                     else:
                         st.info("未计算出半成品需求")
                 
@@ -547,33 +672,26 @@ with tab3:
                         # 可视化
                         if len(st.session_state.purchase_plan) > 0:
                             # 按月份汇总采购量和成本
-                            monthly_purchase = st.session_state.purchase_plan.groupby(['年份', '月份']).agg({
-                                '计划采购量': 'sum',
-                                '预计成本': 'sum'
-                            }).reset_index()
+                            monthly_labels, monthly_quantity, monthly_cost = summarize_monthly_purchase(st.session_state.purchase_plan)
                             
-                            # 创建月份标签
-                            monthly_labels = [f"{year}-{month}" for year, month in zip(monthly_purchase['年份'], monthly_purchase['月份'])]
-                            
-                            fig, ax1 = plt.subplots(figsize=(10, 6))
+                            fig = go.Figure()
                             
                             # 绘制采购量
-                            ax1.bar(monthly_labels, monthly_purchase['计划采购量'], color='blue', alpha=0.7)
-                            ax1.set_xlabel('年月')
-                            ax1.set_ylabel('采购量', color='blue')
-                            ax1.tick_params(axis='y', labelcolor='blue')
+                            fig.add_trace(go.Bar(x=monthly_labels, y=monthly_quantity, marker_color='blue', opacity=0.7, name='采购量'))
                             
                             # 添加第二个Y轴显示成本
-                            ax2 = ax1.twinx()
-                            ax2.plot(monthly_labels, monthly_purchase['预计成本'], 'r-', marker='o')
-                            ax2.set_ylabel('采购成本', color='red')
-                            ax2.tick_params(axis='y', labelcolor='red')
+                            fig.add_trace(go.Scatter(x=monthly_labels, y=monthly_cost, mode='lines+markers',
+                                                     line_color='red', name='采购成本', yaxis='y2'))
                             
-                            plt.title('月度采购计划')
-                            plt.xticks(rotation=45)
-                            plt.tight_layout()
+                            fig.update_layout(
+                                title='月度采购计划',
+                                xaxis=dict(title='年月', type='category', tickangle=-45),
+                                yaxis=dict(title=dict(text='采购量', font_color='blue'), tickfont_color='blue'),
+                                yaxis2=dict(title=dict(text='采购成本', font_color='red'), tickfont_color='red',
+                                            overlaying='y', side='right')
+                            )
                             
-                            st.pyplot(fig)
+                            st.plotly_chart(fig, use_container_width=True)
                             
                             # 显示总成本
                             total_cost = st.session_state.purchase_plan['预计成本'].sum()
@@ -614,17 +732,19 @@ with tab4:
             if st.button("生成导出文件"):
                 with st.spinner("正在准备导出文件，请稍候..."):
                     try:
-                        # 确保导出目录存在
-                        if not os.path.exists("data/exports"):
-                            os.makedirs("data/exports", exist_ok=True)
-                        
-                        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+                        # 仅在点击导出时生成时间戳，time.strftime 无需构造datetime对象
+                        timestamp = time.strftime("%Y%m%d%H%M%S")
                         
                         if export_format == "Excel (.xlsx)":
-                            # 导出为Excel
-                            file_path = f"data/exports/MRP计算结果_{timestamp}.xlsx"
+                            # 导出为Excel，直接写入内存缓冲区
+                            buffer = io.BytesIO()
                             
-                            with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
+                            # xlsxwriter写入多个sheet比openpyxl快；关闭URL识别，写入字符串时无需逐个匹配链接格式
+                            with pd.ExcelWriter(
+                                buffer,
+                                engine='xlsxwriter',
+                                engine_kwargs={'options': {'strings_to_urls': False}}
+                            ) as writer:
                                 # 根据选项决定导出内容
                                 if export_option in ["导出所有结果", "仅导出原材料需求"]:
                                     # 导出原材料需求
@@ -659,26 +779,18 @@ with tab4:
                                             index=False
                                         )
                             
-                            # 读取Excel文件内容
-                            with open(file_path, "rb") as file:
-                                excel_bytes = file.read()
-                            
                             # 提供下载链接
                             st.download_button(
                                 label="下载Excel结果文件",
-                                data=excel_bytes,
+                                data=buffer.getvalue(),
                                 file_name=f"MRP计算结果_{timestamp}.xlsx",
                                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                             )
                         else:
                             # 导出为CSV，由于CSV只能存一个表，因此根据选项决定导出内容
                             if export_option == "仅导出采购计划" and 'purchase_plan' in st.session_state and st.session_state.purchase_plan is not None:
-                                file_path = f"data/exports/采购计划_{timestamp}.csv"
-                                st.session_state.purchase_plan.to_csv(file_path, index=False, encoding='utf-8-sig')
-                                
-                                # 读取CSV文件内容
-                                with open(file_path, "rb") as file:
-                                    csv_bytes = file.read()
+                                # 直接在内存中生成CSV内容
+                                csv_bytes = st.session_state.purchase_plan.to_csv(index=False).encode('utf-8-sig')
                                 
                                 # 提供下载链接
                                 st.download_button(
@@ -688,12 +800,8 @@ with tab4:
                                     mime="text/csv"
                                 )
                             elif export_option == "仅导出原材料需求":
-                                file_path = f"data/exports/原材料需求_{timestamp}.csv"
-                                st.session_state.raw_material_requirements.to_csv(file_path, index=False, encoding='utf-8-sig')
-                                
-                                # 读取CSV文件内容
-                                with open(file_path, "rb") as file:
-                                    csv_bytes = file.read()
+                                # 直接在内存中生成CSV内容
+                                csv_bytes = st.session_state.raw_material_requirements.to_csv(index=False).encode('utf-8-sig')
                                 
                                 # 提供下载链接
                                 st.download_button(
@@ -719,6 +827,8 @@ with tab4:
                             if not os.path.exists("data/reports"):
                                 os.makedirs("data/reports", exist_ok=True)
                             
+                            # 报告目录使用本次点击时生成的时间戳，不依赖导出按钮中的变量
+                            timestamp = time.strftime("%Y%m%d%H%M%S")
                             report_path = f"data/reports/MRP报告_{timestamp}"
                             
                             # 创建目录
@@ -4,6 +4,16 @@ from datetime import datetime
 import os
 import logging
 
+# 可选依赖：pyarrow读取CSV更快，未安装时使用默认引擎
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 日期列按字符串读取，由process_data统一转换（pyarrow引擎默认会推断为日期对象）
+DATE_COLUMNS = ['销售请求日期', '仓库实际日期']
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -37,7 +47,10 @@ class DataProcessor:
             _, file_extension = os.path.splitext(file_path)
             
             if file_extension.lower() == '.csv':
-                df = pd.read_csv(file_path)
+                if PYARROW_AVAILABLE:
+                    df = pd.read_csv(file_path, engine='pyarrow', dtype={column: str for column in DATE_COLUMNS})
+                else:
+                    df = pd.read_csv(file_path)
             elif file_extension.lower() in ['.xls', '.xlsx']:
                 df = pd.read_excel(file_path)
             else:
@@ -2,11 +2,18 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
-from statsmodels.tsa.arima.model import ARIMA
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-from statsmodels.tsa.seasonal import seasonal_decompose
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import warnings
 
+# 可选依赖：安装statsforecast时，ARIMA和指数平滑使用其numba编译的实现，未安装时使用statsmodels
+try:
+    from statsforecast.models import ARIMA as SFARIMA, AutoETS
+    STATSFORECAST_AVAILABLE = True
+except ImportError:
+    STATSFORECAST_AVAILABLE = False
+
 # 忽略警告信息，避免在预测中显示过多的警告
 warnings.filterwarnings("ignore")
 
@@ -17,6 +24,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 物料数达到该值时才启用多进程预测，物料较少时进程启动开销大于收益
+PARALLEL_MIN_MATERIALS = 20
+
+def _forecast_one_material(material_id, time_series, method, periods):
+    """
+    在子进程中预测单个物料（模块级函数，便于多进程序列化）
+    
+    返回:
+        tuple: (预测结果DataFrame或None, 使用的预测方法, 准确率信息或None)
+    """
+    forecaster = Forecaster()
+    forecaster.forecast_periods = periods
+    forecast_result, chosen_method = forecaster.forecast_material(material_id, time_series, method, periods)
+    return forecast_result, chosen_method, forecaster.forecast_accuracy.get(material_id)
+
 class Forecaster:
     """
     销售预测模块，支持多种预测算法和参数调整
@@ -134,25 +156,40 @@ class Forecaster:
             # 转换为浮点类型
             time_series = time_series.astype(float)
             
-            # 训练ARIMA模型
-            model = ARIMA(time_series, order=order)
-            model_fit = model.fit()
-            
-            # 预测
-            forecast_result = model_fit.forecast(steps=periods)
-            
-            # 获取置信区间
-            forecast_ci = model_fit.get_forecast(steps=periods).conf_int(alpha=0.05)
-            
             # 创建预测结果DataFrame
             last_date = time_series.index[-1]
             forecast_dates = [last_date + i + 1 for i in range(periods)]
             
-            forecast_df = pd.DataFrame({
-                '预测值': forecast_result,
-                '下限': forecast_ci.iloc[:, 0].values,
-                '上限': forecast_ci.iloc[:, 1].values
-            }, index=forecast_dates)
+            if STATSFORECAST_AVAILABLE:
+                # 使用statsforecast训练并预测，置信水平与statsmodels分支一致(95%)
+                sf_result = SFARIMA(order=order).forecast(y=time_series.to_numpy(), h=periods, level=[95])
+                
+                forecast_df = pd.DataFrame({
+                    '预测值': sf_result['mean'],
+                    '下限': sf_result['lo-95'],
+                    '上限': sf_result['hi-95']
+                }, index=forecast_dates)
+            else:
+                # statsmodels导入较慢，仅在实际预测时导入
+                from statsmodels.tsa.arima.model import ARIMA
+                # statsmodels导入时会注册自己的警告过滤器（如ConvergenceWarning），需重新屏蔽
+                warnings.filterwarnings("ignore")
+                
+                # 训练ARIMA模型
+                model = ARIMA(time_series, order=order)
+                model_fit = model.fit()
+                
+                # 预测
+                forecast_result = model_fit.forecast(steps=periods)
+                
+                # 获取置信区间
+                forecast_ci = model_fit.get_forecast(steps=periods).conf_int(alpha=0.05)
+                
+                forecast_df = pd.DataFrame({
+                    '预测值': forecast_result.values,
+                    '下限': forecast_ci.iloc[:, 0].values,
+                    '上限': forecast_ci.iloc[:, 1].values
+                }, index=forecast_dates)
             
             logger.info(f"ARIMA预测完成，预测 {periods} 期")
             return forecast_df
@@ -189,6 +226,9 @@ class Forecaster:
             
             # 自动检测趋势和季节性类型
             if trend is None or seasonal is None:
+                from statsmodels.tsa.seasonal import seasonal_decompose
+                warnings.filterwarnings("ignore")
+                
                 # 对数据进行简单分析
                 decomposition = seasonal_decompose(time_series, model='multiplicative', period=seasonal_periods)
                 
@@ -202,18 +242,31 @@ class Forecaster:
                 if seasonal is None:
                     seasonal = 'mul' if season_strength > 0.3 else None
             
-            # 创建并训练模型
-            model = ExponentialSmoothing(
-                time_series,
-                trend=trend,
-                seasonal=seasonal,
-                seasonal_periods=seasonal_periods,
-                damped_trend=damped_trend
-            )
-            model_fit = model.fit(optimized=True)
-            
-            # 预测
-            forecast_result = model_fit.forecast(periods)
+            if STATSFORECAST_AVAILABLE:
+                # 使用statsforecast的ETS模型：误差类型自动选择，趋势和季节性沿用上面的设置
+                ets_codes = {'add': 'A', 'mul': 'M', None: 'N'}
+                model = AutoETS(
+                    season_length=seasonal_periods,
+                    model='Z' + ets_codes[trend] + ets_codes[seasonal],
+                    damped=damped_trend if trend else None
+                )
+                forecast_result = model.forecast(y=time_series.to_numpy(), h=periods)['mean']
+            else:
+                from statsmodels.tsa.holtwinters import ExponentialSmoothing
+                warnings.filterwarnings("ignore")
+                
+                # 创建并训练模型
+                model = ExponentialSmoothing(
+                    time_series,
+                    trend=trend,
+                    seasonal=seasonal,
+                    seasonal_periods=seasonal_periods,
+                    damped_trend=damped_trend
+                )
+                model_fit = model.fit(optimized=True)
+                
+                # 预测
+                forecast_result = model_fit.forecast(periods).values
             
             # 创建预测结果DataFrame
             last_date = time_series.index[-1]
@@ -326,7 +379,7 @@ class Forecaster:
                         
                         # 防止除以零
                         valid_indices = actual_values != 0
-                        if not any(valid_indices):
+                        if not valid_indices.any():
                             errors[name] = float('inf')
                             continue
                             
@@ -358,7 +411,38 @@ class Forecaster:
             logger.error(f"选择最佳预测方法时出错: {str(e)}")
             return "moving_average"  # 默认方法
     
-    def generate_forecast(self, material_id=None, periods=None, method=None):
+    def forecast_material(self, material_id, time_series, method=None, periods=None):
+        """
+        使用指定方法（或自动选择的最佳方法）预测单个物料
+        
+        参数:
+            material_id: 物料编号
+            time_series: 该物料的时间序列数据
+            method: 指定预测方法，如果为None则自动选择
+            periods: 预测期数，如果为None则使用默认值
+            
+        返回:
+            tuple: (预测结果DataFrame或None, 使用的预测方法)
+        """
+        periods = periods or self.forecast_periods
+        
+        # 选择预测方法
+        if method:
+            chosen_method = method
+        else:
+            chosen_method = self.select_best_method(time_series, material_id)
+        
+        # 根据选择的方法进行预测
+        if chosen_method == "arima":
+            forecast_result = self.forecast_arima(time_series, periods)
+        elif chosen_method == "exp_smoothing":
+            forecast_result = self.forecast_exponential_smoothing(time_series, periods)
+        else:  # 默认移动平均
+            forecast_result = self.forecast_moving_average(time_series, periods)
+        
+        return forecast_result, chosen_method
+    
+    def generate_forecast(self, material_id=None, periods=None, method=None, n_jobs=1):
         """
         生成预测
         
@@ -366,6 +450,7 @@ class Forecaster:
             material_id: 物料编号，如果为None则预测所有物料
             periods: 预测期数，如果为None则使用默认值
             method: 指定预测方法，如果为None则自动选择
+            n_jobs: 并行进程数，1表示串行，-1表示使用全部CPU核心
             
         返回:
             DataFrame: 预测结果
@@ -385,34 +470,43 @@ class Forecaster:
             else:
                 materials = self.historical_data['物料编号'].unique()
             
-            # 最后一个历史日期
-            max_date = self.historical_data['日期'].max()
-            forecast_start_date = pd.to_datetime(max_date) + pd.DateOffset(months=1)
+            # 准备各物料的时间序列
+            material_ids = []
+            time_series_list = []
             
-            # 预测每个物料
             for mat_id in materials:
-                # 准备时间序列
                 ts = self.prepare_time_series(mat_id)
                 
                 if ts is None or len(ts) < 4:  # 至少需要4期数据
                     logger.warning(f"物料 {mat_id} 的历史数据不足，跳过预测")
                     continue
                 
-                # 选择预测方法
-                if method:
-                    chosen_method = method
-                else:
-                    chosen_method = self.select_best_method(ts, mat_id)
-                
-                # 根据选择的方法进行预测
-                forecast_result = None
-                
-                if chosen_method == "arima":
-                    forecast_result = self.forecast_arima(ts, periods)
-                elif chosen_method == "exp_smoothing":
-                    forecast_result = self.forecast_exponential_smoothing(ts, periods)
-                else:  # 默认移动平均
-                    forecast_result = self.forecast_moving_average(ts, periods)
+                material_ids.append(mat_id)
+                time_series_list.append(ts)
+            
+            # 预测每个物料，物料较多时分发到多个进程并行计算
+            results = None
+            
+            if n_jobs != 1 and len(material_ids) >= PARALLEL_MIN_MATERIALS:
+                try:
+                    max_workers = os.cpu_count() if n_jobs == -1 else n_jobs
+                    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                        results = list(executor.map(
+                            _forecast_one_material, material_ids, time_series_list, repeat(method), repeat(periods)
+                        ))
+                except Exception as e:
+                    logger.warning(f"并行预测失败，改为串行预测: {str(e)}")
+                    results = None
+            
+            if results is None:
+                results = []
+                for mat_id, ts in zip(material_ids, time_series_list):
+                    forecast_result, chosen_method = self.forecast_material(mat_id, ts, method, periods)
+                    results.append((forecast_result, chosen_method, self.forecast_accuracy.get(mat_id)))
+            
+            for mat_id, (forecast_result, chosen_method, accuracy) in zip(material_ids, results):
+                if accuracy is not None:
+                    self.forecast_accuracy[mat_id] = accuracy
                 
                 if forecast_result is not None:
                     # 添加物料信息
@@ -470,7 +564,7 @@ class Forecaster:
                   (self.forecast_data['年份'] == year) & 
                   (self.forecast_data['月份'] == month))
             
-            if not any(mask):
+            if not mask.any():
                 logger.error(f"未找到要调整的预测: 物料={material_id}, 年月={year}-{month}")
                 return False
             
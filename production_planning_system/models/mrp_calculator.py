@@ -2,7 +2,8 @@ import pandas as pd
 import numpy as np
 import logging
 import os
-from datetime import datetime, timedelta
+import math
+from datetime import datetime
 from collections import defaultdict
 # 移除 from ortools.linear_solver import pywraplp
 
@@ -13,6 +14,50 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 可选依赖：安装numba时，大规模采购计划的库存递推使用JIT编译并按物料并行计算
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# 原材料 × 期间 的单元数达到该值时才使用numba内核，小规模计划不值得付出编译开销
+NUMBA_MIN_CELLS = 50000
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _plan_purchases_kernel(demand_matrix, initial_inventory, min_order_qty, safety_stock_days, order_multiple):
+        """按物料并行执行采购递推，逻辑与 MRPCalculator._plan_purchases 的NumPy实现一致"""
+        num_materials, num_periods = demand_matrix.shape
+        purchase_matrix = np.zeros((num_materials, num_periods))
+        beginning_matrix = np.empty((num_materials, num_periods))
+        net_matrix = np.empty((num_materials, num_periods))
+        ending_matrix = np.empty((num_materials, num_periods))
+        
+        for m in prange(num_materials):
+            current_inventory = initial_inventory[m]
+            lot_size = min_order_qty[m]
+            for t in range(num_periods):
+                demand = demand_matrix[m, t]
+                safety_stock = demand * safety_stock_days / 30
+                net_demand = max(0.0, demand + safety_stock - current_inventory)
+                
+                purchase = 0.0
+                if net_demand > 0:
+                    purchase = max(net_demand, lot_size)
+                    if order_multiple > 1:
+                        purchase = math.ceil(purchase / (lot_size * order_multiple)) * (lot_size * order_multiple)
+                    elif order_multiple == 1 and lot_size > 1:
+                        purchase = math.ceil(purchase / lot_size) * lot_size
+                
+                purchase_matrix[m, t] = purchase
+                beginning_matrix[m, t] = current_inventory
+                net_matrix[m, t] = net_demand
+                current_inventory = current_inventory + purchase - demand
+                ending_matrix[m, t] = current_inventory
+        
+        return purchase_matrix, beginning_matrix, net_matrix, ending_matrix
+
 class MRPCalculator:
     """
     原材料需求计划(MRP)计算模块
@@ -280,87 +325,28 @@ class MRPCalculator:
                 logger.warning(f"计划期数超过设定值，已截断为 {planning_horizon} 期")
                 time_periods = time_periods.head(planning_horizon)
             
-            # 分配原材料需求
-            raw_periods_data = []
-            
-            for _, row in self.raw_material_requirements.iterrows():
-                material_id = row['物料编号']
-                total_demand = row['需求量']
-                
-                # 获取生产计划中该物料的每期需求比例
-                production_by_period = {}
-                total_production = 0
-                
-                for _, prod_row in self.production_plan.iterrows():
-                    year, month = prod_row['年份'], prod_row['月份']
-                    if (year, month) in [(y, m) for _, y, m in time_periods.itertuples()]:
-                        production = prod_row['计划产量']
-                        production_by_period[(year, month)] = production_by_period.get((year, month), 0) + production
-                        total_production += production
-                
-                # 按比例分配需求
-                for _, tp_row in time_periods.iterrows():
-                    year, month = tp_row['年份'], tp_row['月份']
-                    
-                    if total_production > 0:
-                        period_ratio = production_by_period.get((year, month), 0) / total_production
-                        period_demand = total_demand * period_ratio
-                    else:
-                        # 如果总产量为0，则平均分配
-                        period_demand = total_demand / len(time_periods)
-                    
-                    raw_periods_data.append({
-                        '年份': year,
-                        '月份': month,
-                        '物料编号': material_id,
-                        '物料类型': row['物料类型'],
-                        '描述': row['描述'],
-                        '期间需求量': period_demand,
-                        '总需求量': total_demand
-                    })
-            
-            # 分配半成品需求
-            semifinished_periods_data = []
-            
-            for _, row in self.semifinished_requirements.iterrows():
-                material_id = row['物料编号']
-                total_demand = row['需求量']
-                
-                # 获取生产计划中该物料的每期需求比例
-                production_by_period = {}
-                total_production = 0
-                
-                for _, prod_row in self.production_plan.iterrows():
-                    year, month = prod_row['年份'], prod_row['月份']
-                    if (year, month) in [(y, m) for _, y, m in time_periods.itertuples()]:
-                        production = prod_row['计划产量']
-                        production_by_period[(year, month)] = production_by_period.get((year, month), 0) + production
-                        total_production += production
-                
-                # 按比例分配需求
-                for _, tp_row in time_periods.iterrows():
-                    year, month = tp_row['年份'], tp_row['月份']
-                    
-                    if total_production > 0:
-                        period_ratio = production_by_period.get((year, month), 0) / total_production
-                        period_demand = total_demand * period_ratio
-                    else:
-                        # 如果总产量为0，则平均分配
-                        period_demand = total_demand / len(time_periods)
-                    
-                    semifinished_periods_data.append({
-                        '年份': year,
-                        '月份': month,
-                        '物料编号': material_id,
-                        '物料类型': row['物料类型'],
-                        '描述': row['描述'],
-                        '期间需求量': period_demand,
-                        '总需求量': total_demand
-                    })
+            # 汇总生产计划在各期的产量（各物料的分配比例相同，只需计算一次）
+            period_keys = list(zip(time_periods['年份'], time_periods['月份']))
+            production_by_period = dict.fromkeys(period_keys, 0)
+            total_production = 0
+            
+            for year, month, production in zip(self.production_plan['年份'],
+                                               self.production_plan['月份'],
+                                               self.production_plan['计划产量']):
+                if (year, month) in production_by_period:
+                    production_by_period[(year, month)] += production
+                    total_production += production
+            
+            # 各期分配比例，总产量为0时平均分配
+            if total_production > 0:
+                period_ratios = np.array([production_by_period[key] / total_production for key in period_keys],
+                                         dtype=np.float64)
+            else:
+                period_ratios = None
             
-            # 创建DataFrame
-            raw_periods_df = pd.DataFrame(raw_periods_data)
-            semifinished_periods_df = pd.DataFrame(semifinished_periods_data)
+            # 按比例分配需求
+            raw_periods_df = self._spread_requirements(self.raw_material_requirements, time_periods, period_ratios)
+            semifinished_periods_df = self._spread_requirements(self.semifinished_requirements, time_periods, period_ratios)
             
             logger.info(f"成功分配需求到各时间段，原材料: {len(raw_periods_df)}条，半成品: {len(semifinished_periods_df)}条")
             return raw_periods_df, semifinished_periods_df
@@ -369,6 +355,40 @@ class MRPCalculator:
             logger.error(f"分配需求到各时间段失败: {str(e)}")
             return None, None
     
+    def _spread_requirements(self, requirements, time_periods, period_ratios):
+        """
+        按各期比例把总需求展开为按期需求（物料在外、期间在内）
+        
+        参数:
+            requirements: 物料需求DataFrame
+            time_periods: 排序后的计划期DataFrame（年份、月份）
+            period_ratios: 各期分配比例数组，为None时平均分配
+            
+        返回:
+            DataFrame: 按期需求
+        """
+        num_periods = len(time_periods)
+        num_materials = len(requirements)
+        total_demand = requirements['需求量'].to_numpy(dtype=np.float64)
+        
+        if period_ratios is not None:
+            period_demand = np.multiply.outer(total_demand, period_ratios)
+        else:
+            period_demand = np.repeat((total_demand / num_periods)[:, None], num_periods, axis=1)
+        
+        def repeat_column(column):
+            return requirements[column].repeat(num_periods).reset_index(drop=True)
+        
+        return pd.DataFrame({
+            '年份': np.tile(time_periods['年份'].to_numpy(), num_materials),
+            '月份': np.tile(time_periods['月份'].to_numpy(), num_materials),
+            '物料编号': repeat_column('物料编号'),
+            '物料类型': repeat_column('物料类型'),
+            '描述': repeat_column('描述'),
+            '期间需求量': period_demand.ravel(),
+            '总需求量': repeat_column('需求量')
+        })
+    
     def get_material_inventory(self, material_id, material_type):
         """
         获取指定物料的库存量
@@ -440,116 +460,94 @@ class MRPCalculator:
                 logger.error("分配需求到各时间段失败")
                 return None
             
-            # 准备采购计划数据
-            purchase_plan_data = []
-            
             # 获取计划期数
             time_periods = sorted(raw_periods_df[['年份', '月份']].drop_duplicates().itertuples(index=False, name=None),
                                key=lambda x: x[0] * 12 + x[1])
+            years = np.array([year for year, _ in time_periods])
+            months = np.array([month for _, month in time_periods])
             
             # 获取MRP参数
             safety_stock_days = self.mrp_parameters.get('safety_stock_days', 15)
             order_multiple = self.mrp_parameters.get('order_multiple', 1)
             
-            # 对每种原材料生成采购计划
-            for material_id in raw_periods_df['物料编号'].unique():
-                material_periods = raw_periods_df[raw_periods_df['物料编号'] == material_id].sort_values(['年份', '月份'])
-                
-                if material_periods.empty:
-                    continue
-                
-                # 获取物料描述
-                material_desc = material_periods.iloc[0]['描述']
-                
-                # 获取物料初始库存
-                inventory = self.get_material_inventory(material_id, "基础原料")
-                
-                # 获取供应商信息
-                suppliers = self.get_supplier_info(material_id)
-                
-                if suppliers.empty:
-                    # 如果没有供应商信息，创建默认供应商
-                    supplier_id = "默认供应商"
-                    lead_time = 15  # 默认采购提前期为15天
-                    min_order_qty = 100  # 默认最小订购量为100
-                    price = 1.0  # 默认单价为1.0
-                else:
-                    # 选择首选供应商（这里可以添加更复杂的供应商选择逻辑）
-                    supplier = suppliers.iloc[0]
-                    supplier_id = supplier['供应商编号']
-                    lead_time = supplier['采购提前期']
-                    min_order_qty = supplier['最小订购量']
-                    price = supplier['单价']
-                
-                # 处理每个时间段
-                for i, (year, month) in enumerate(time_periods):
-                    # 获取当期的需求
-                    current_data = material_periods[
-                        (material_periods['年份'] == year) &
-                        (material_periods['月份'] == month)
-                    ]
-                    
-                    if current_data.empty:
-                        demand = 0
-                    else:
-                        demand = current_data.iloc[0]['期间需求量']
-                    
-                    # 计算安全库存
-                    safety_stock = demand * safety_stock_days / 30
-                    
-                    # 计算净需求量: 需求 + 安全库存 - 期初库存
-                    net_demand = max(0, demand + safety_stock - inventory)
-                    
-                    # 确定采购量
-                    if net_demand > 0:
-                        # 应用最小订购量
-                        purchase = max(net_demand, min_order_qty)
-                        
-                        # 应用订单倍数（向上取整到最小订单量的整数倍）
-                        if order_multiple > 1:
-                            purchase = np.ceil(purchase / (min_order_qty * order_multiple)) * (min_order_qty * order_multiple)
-                        elif order_multiple == 1 and min_order_qty > 1:
-                            purchase = np.ceil(purchase / min_order_qty) * min_order_qty
-                    else:
-                        purchase = 0
-                    
-                    # 更新库存: 期初库存 + 采购 - 需求
-                    previous_inventory = inventory
-                    inventory = previous_inventory + purchase - demand
-                    
-                    # 计算预计到货日期和订单下达日期
-                    delivery_date = datetime(year, month, 1)
-                    order_date = delivery_date - timedelta(days=lead_time)
-                    
-                    # 只有在有采购时才添加到计划
-                    if purchase > 0:
-                        # 计算采购成本
-                        purchase_cost = purchase * price
-                        
-                        plan_data = {
-                            '年份': year,
-                            '月份': month,
-                            '物料编号': material_id,
-                            '描述': material_desc,
-                            '物料类型': "基础原料",
-                            '毛需求量': demand,
-                            '期初库存': round(previous_inventory, 2),
-                            '净需求量': round(net_demand, 2),
-                            '计划采购量': round(purchase, 2),
-                            '期末库存': round(inventory, 2),
-                            '供应商': supplier_id,
-                            '采购提前期': lead_time,
-                            '订单下达日期': order_date.strftime('%Y-%m-%d'),
-                            '预计到货日期': delivery_date.strftime('%Y-%m-%d'),
-                            '单价': price,
-                            '预计成本': round(purchase_cost, 2)
-                        }
-                        
-                        purchase_plan_data.append(plan_data)
+            # 构建需求矩阵（原材料 × 期间），同一物料同一期间保留首条记录
+            materials = raw_periods_df['物料编号'].unique()
+            first_rows = raw_periods_df.drop_duplicates(['物料编号', '年份', '月份'])
+            demand_matrix = np.zeros((len(materials), len(time_periods)))
+            demand_matrix[
+                pd.Index(materials).get_indexer(first_rows['物料编号']),
+                pd.Index(years * 12 + months).get_indexer(first_rows['年份'] * 12 + first_rows['月份'])
+            ] = first_rows['期间需求量'].to_numpy(dtype=np.float64)
+            
+            # 获取物料描述
+            first_material_rows = raw_periods_df.drop_duplicates('物料编号')
+            material_desc = dict(zip(first_material_rows['物料编号'], first_material_rows['描述']))
+            
+            # 获取物料初始库存，同一物料保留首条记录，没有库存记录的物料为0
+            inventory_index = {}
+            if self.raw_material_inventory is not None:
+                unique_inventory = self.raw_material_inventory.drop_duplicates('物料编号')
+                inventory_index = dict(zip(unique_inventory['物料编号'], unique_inventory['库存数量']))
+            
+            # 获取供应商信息，选择每种物料的首选供应商（这里可以添加更复杂的供应商选择逻辑）
+            supplier_index = {}
+            if self.supplier_data is not None:
+                unique_suppliers = self.supplier_data.drop_duplicates('物料编号')
+                supplier_index = dict(zip(
+                    unique_suppliers['物料编号'],
+                    zip(unique_suppliers['供应商编号'], unique_suppliers['采购提前期'],
+                        unique_suppliers['最小订购量'], unique_suppliers['单价'])
+                ))
+            
+            # 如果没有供应商信息，使用默认供应商：采购提前期15天，最小订购量100，单价1.0
+            default_supplier = ("默认供应商", 15, 100, 1.0)
+            material_suppliers = [supplier_index.get(material_id, default_supplier) for material_id in materials]
+            
+            material_info = pd.DataFrame({
+                '描述': [material_desc[material_id] for material_id in materials],
+                '供应商': [supplier[0] for supplier in material_suppliers],
+                '采购提前期': [supplier[1] for supplier in material_suppliers],
+                '单价': [supplier[3] for supplier in material_suppliers]
+            })
+            initial_inventory = np.array([inventory_index.get(material_id, 0) for material_id in materials], dtype=np.float64)
+            min_order_qty = np.array([supplier[2] for supplier in material_suppliers], dtype=np.float64)
+            
+            # 逐期递推库存和采购量
+            purchase_matrix, beginning_matrix, net_matrix, ending_matrix = self._plan_purchases(
+                demand_matrix, initial_inventory, min_order_qty, safety_stock_days, order_multiple
+            )
+            
+            # 只有在有采购时才添加到计划，按物料、期间的顺序取出有采购的单元
+            material_idx, period_idx = np.nonzero(purchase_matrix > 0)
             
             # 创建DataFrame
-            if purchase_plan_data:
-                purchase_plan_df = pd.DataFrame(purchase_plan_data)
+            if len(material_idx) > 0:
+                purchases = purchase_matrix[material_idx, period_idx]
+                material_rows = material_info.take(material_idx).reset_index(drop=True)
+                
+                # 计算预计到货日期和订单下达日期
+                delivery_dates = pd.to_datetime(pd.DataFrame({'year': years, 'month': months, 'day': 1})).iloc[period_idx].reset_index(drop=True)
+                order_dates = delivery_dates - pd.to_timedelta(material_rows['采购提前期'].to_numpy(dtype=np.float64), unit='D')
+                
+                purchase_plan_df = pd.DataFrame({
+                    '年份': years[period_idx],
+                    '月份': months[period_idx],
+                    '物料编号': materials[material_idx],
+                    '描述': material_rows['描述'],
+                    '物料类型': "基础原料",
+                    '毛需求量': demand_matrix[material_idx, period_idx],
+                    '期初库存': np.round(beginning_matrix[material_idx, period_idx], 2),
+                    '净需求量': np.round(net_matrix[material_idx, period_idx], 2),
+                    '计划采购量': np.round(purchases, 2),
+                    '期末库存': np.round(ending_matrix[material_idx, period_idx], 2),
+                    '供应商': material_rows['供应商'],
+                    '采购提前期': material_rows['采购提前期'],
+                    '订单下达日期': order_dates.dt.strftime('%Y-%m-%d'),
+                    '预计到货日期': delivery_dates.dt.strftime('%Y-%m-%d'),
+                    '单价': material_rows['单价'],
+                    # 计算采购成本
+                    '预计成本': np.round(purchases * material_rows['单价'].to_numpy(dtype=np.float64), 2)
+                })
                 
                 # 排序
                 purchase_plan_df = purchase_plan_df.sort_values(['物料编号', '年份', '月份'])
@@ -564,11 +562,75 @@ class MRPCalculator:
                 return pd.DataFrame()
                 
         except Exception as e:
-            logger.error(f"生成采购计划失败: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception(f"生成采购计划失败: {str(e)}")
             return None
     
+    def _plan_purchases(self, demand_matrix, initial_inventory, min_order_qty, safety_stock_days, order_multiple):
+        """
+        按期递推计算各原材料的净需求、采购量和期初/期末库存
+        
+        参数:
+            demand_matrix: 需求矩阵（原材料 × 期间）
+            initial_inventory: 各原材料初始库存
+            min_order_qty: 各原材料最小订购量
+            safety_stock_days: 安全库存天数
+            order_multiple: 订单倍数
+            
+        返回:
+            tuple: (采购量矩阵, 期初库存矩阵, 净需求量矩阵, 期末库存矩阵)
+        """
+        if NUMBA_AVAILABLE and demand_matrix.size >= NUMBA_MIN_CELLS:
+            return _plan_purchases_kernel(
+                np.ascontiguousarray(demand_matrix, dtype=np.float64),
+                np.ascontiguousarray(initial_inventory, dtype=np.float64),
+                np.ascontiguousarray(min_order_qty, dtype=np.float64),
+                float(safety_stock_days),
+                float(order_multiple)
+            )
+        
+        # 计算安全库存
+        safety_matrix = demand_matrix * safety_stock_days / 30
+        
+        # 订单批量：订单倍数大于1时为最小订购量的倍数，否则为最小订购量本身
+        if order_multiple > 1:
+            batch_size = min_order_qty * order_multiple
+            round_up = np.ones(len(min_order_qty), dtype=bool)
+        else:
+            batch_size = min_order_qty
+            round_up = (min_order_qty > 1) & (order_multiple == 1)
+        
+        num_materials, num_periods = demand_matrix.shape
+        purchase_matrix = np.zeros((num_materials, num_periods))
+        beginning_matrix = np.empty((num_materials, num_periods))
+        net_matrix = np.empty((num_materials, num_periods))
+        ending_matrix = np.empty((num_materials, num_periods))
+        
+        # 逐期递推，每期对所有物料做向量运算
+        current_inventory = initial_inventory
+        for t in range(num_periods):
+            demand = demand_matrix[:, t]
+            
+            # 计算净需求量: 需求 + 安全库存 - 期初库存
+            net_demand = np.maximum(0, demand + safety_matrix[:, t] - current_inventory)
+            
+            # 应用最小订购量，并向上取整到订单批量的整数倍
+            purchase = np.maximum(net_demand, min_order_qty)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                purchase = np.where(round_up, np.ceil(purchase / batch_size) * batch_size, purchase)
+            purchase = np.where(net_demand > 0, purchase, 0)
+            
+            # 更新库存: 期初库存 + 采购 - 需求
+            ending_inventory = current_inventory + purchase - demand
+            
+            purchase_matrix[:, t] = purchase
+            beginning_matrix[:, t] = current_inventory
+            net_matrix[:, t] = net_demand
+            ending_matrix[:, t] = ending_inventory
+            
+            current_inventory = ending_inventory
+        
+        return purchase_matrix, beginning_matrix, net_matrix, ending_matrix
+    
     def generate_semifinished_production_plan(self):
         """
         根据半成品需求生成半成品生产计划
@@ -588,61 +650,48 @@ class MRPCalculator:
                 logger.error("分配需求到各时间段失败")
                 return None
             
-            # 准备生产计划数据
-            production_plan_data = []
-            
-            # 获取计划期数
-            time_periods = sorted(semifinished_periods_df[['年份', '月份']].drop_duplicates().itertuples(index=False, name=None),
-                               key=lambda x: x[0] * 12 + x[1])
-            
             # 订单倍数
             order_multiple = self.mrp_parameters.get('order_multiple', 1)
             
-            # 对每种半成品生成生产计划
-            for material_id in semifinished_periods_df['物料编号'].unique():
-                material_periods = semifinished_periods_df[semifinished_periods_df['物料编号'] == material_id].sort_values(['年份', '月份'])
-                
-                if material_periods.empty:
-                    continue
+            # 整理为 物料 x 期间 的需求矩阵，按期逐列推进库存
+            periods_df = semifinished_periods_df.sort_values(['年份', '月份'], kind='stable')
+            material_ids = pd.Index(semifinished_periods_df['物料编号'].unique())
+            production_plan_data = []
+            
+            if len(material_ids) > 0:
+                demand_matrix = (periods_df.pivot_table(index='物料编号', columns=['年份', '月份'],
+                                                        values='期间需求量', aggfunc='first', sort=True)
+                                 .reindex(material_ids))
+                demand = demand_matrix.to_numpy(dtype=np.float64)
+                inventory = np.array([self.get_material_inventory(material_id, "半成品") for material_id in material_ids],
+                                     dtype=np.float64)
+                beginning = np.empty_like(demand)
+                production = np.zeros_like(demand)
                 
-                # 获取物料描述
-                material_desc = material_periods.iloc[0]['描述']
+                for period in range(demand.shape[1]):
+                    beginning[:, period] = inventory
+                    net_demand = np.maximum(0, demand[:, period] - inventory)
+                    # 应用订单倍数（向上取整到最小批量的整数倍）
+                    production[:, period] = np.where(net_demand > 0,
+                                                     np.ceil(net_demand / order_multiple) * order_multiple, 0)
+                    inventory = inventory + production[:, period] - demand[:, period]
                 
-                # 获取物料库存
-                inventory = self.get_material_inventory(material_id, "半成品")
+                ending = beginning + production - demand
+                periods = demand_matrix.columns
+                num_materials, num_periods = demand.shape
+                material_desc = periods_df.drop_duplicates('物料编号').set_index('物料编号')['描述'].reindex(material_ids)
                 
-                # 为每个时期创建生产计划
-                for _, row in material_periods.iterrows():
-                    year = row['年份']
-                    month = row['月份']
-                    demand = row['期间需求量']
-                    
-                    # 计算净需求
-                    net_demand = max(0, demand - inventory)
-                    
-                    # 应用订单倍数（向上取整到最小批量的整数倍）
-                    if net_demand > 0:
-                        production = np.ceil(net_demand / order_multiple) * order_multiple
-                    else:
-                        production = 0
-                    
-                    # 更新库存
-                    ending_inventory = inventory + production - demand
-                    
-                    production_plan_data.append({
-                        '年份': year,
-                        '月份': month,
-                        '物料编号': material_id,
-                        '描述': material_desc,
-                        '物料类型': "半成品",
-                        '需求量': demand,
-                        '期初库存': round(inventory, 2),
-                        '计划生产量': round(production, 2),
-                        '期末库存': round(ending_inventory, 2)
-                    })
-                    
-                    # 更新下一期的期初库存
-                    inventory = ending_inventory
+                production_plan_data = {
+                    '年份': np.tile(periods.get_level_values(0).to_numpy(), num_materials),
+                    '月份': np.tile(periods.get_level_values(1).to_numpy(), num_materials),
+                    '物料编号': np.repeat(material_ids.to_numpy(), num_periods),
+                    '描述': np.repeat(material_desc.to_numpy(), num_periods),
+                    '物料类型': "半成品",
+                    '需求量': demand.ravel(),
+                    '期初库存': beginning.ravel().round(2),
+                    '计划生产量': production.ravel().round(2),
+                    '期末库存': ending.ravel().round(2)
+                }
             
             # 创建DataFrame
             if production_plan_data:
@@ -658,9 +707,7 @@ class MRPCalculator:
                 return pd.DataFrame()
                 
         except Exception as e:
-            logger.error(f"生成半成品生产计划失败: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception(f"生成半成品生产计划失败: {str(e)}")
             return None
     
     def generate_mrp_report(self):
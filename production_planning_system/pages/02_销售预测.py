@@ -1,8 +1,6 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 import sys
 from datetime import datetime
@@ -20,6 +18,207 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_data(show_spinner=False)
+def run_forecast(monthly_data, material_id, method, periods, _n_jobs=1):
+    """生成预测，按历史数据内容和预测参数缓存，参数未变化时不再重复计算（并行进程数不影响结果，不参与缓存键）"""
+    forecaster = Forecaster()
+    forecaster.forecast_periods = periods
+    
+    # load_data 会添加日期列，使用副本避免修改传入的数据
+    if not forecaster.load_data(monthly_data.copy()):
+        return None
+    
+    # 默认串行计算，用户开启并行预测时使用多进程
+    forecast_result = forecaster.generate_forecast(material_id=material_id, method=method, n_jobs=_n_jobs)
+    
+    # 物料编号与历史数据使用相同的分类类型
+    if forecast_result is not None and isinstance(monthly_data['物料编号'].dtype, pd.CategoricalDtype):
+        forecast_result['物料编号'] = forecast_result['物料编号'].astype(monthly_data['物料编号'].dtype)
+    
+    # 与历史数据一样按物料和年月排序一次
+    if forecast_result is not None:
+        forecast_result = forecast_result.sort_values(['物料编号', '年份', '月份'], kind='mergesort', ignore_index=True)
+    
+    return forecast_result
+
+def build_chart_data(hist_groups, fore_groups, materials):
+    """
+    将多个物料的历史数据和预测数据合并为长格式的图表数据
+    
+    参数:
+        hist_groups: 物料编号 -> 历史月度数据
+        fore_groups: 物料编号 -> 预测数据
+        materials: 要绘制的物料列表
+        
+    返回:
+        DataFrame: 包含物料编号、年月、类型、数量、下限、上限的图表数据
+    """
+    frames = []
+    
+    for material in materials:
+        hist_data = hist_groups.get(material)
+        fore_data = fore_groups.get(material)
+        
+        if hist_data is None or fore_data is None:
+            continue
+        
+        for data, kind, value_col in ((hist_data, '历史数据', '批次数量'), (fore_data, '预测值', '预测值')):
+            frame = pd.DataFrame({
+                '物料编号': str(material),
+                '年月': pd.to_datetime(pd.DataFrame({'year': data['年份'], 'month': data['月份'], 'day': 1})).to_numpy(),
+                '类型': kind,
+                '数量': data[value_col].to_numpy()
+            })
+            
+            # 预测值附带置信区间
+            if kind == '预测值' and '下限' in data.columns and '上限' in data.columns:
+                frame['下限'] = data['下限'].to_numpy()
+                frame['上限'] = data['上限'].to_numpy()
+            
+            frames.append(frame)
+    
+    if not frames:
+        return None
+    
+    return pd.concat(frames, ignore_index=True)
+
+@st.cache_data(show_spinner=False)
+def build_forecast_chart(chart_data, title):
+    """
+    构建分面的交互式预测图表，每个物料一行，由浏览器端渲染
+    
+    参数:
+        chart_data: build_chart_data 生成的长格式图表数据
+        title: 图表标题
+        
+    返回:
+        plotly Figure
+    """
+    # 绘图库仅在需要绘制图表时导入
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    
+    materials = chart_data['物料编号'].unique().tolist()
+    
+    fig = make_subplots(
+        rows=len(materials), cols=1, shared_xaxes=True,
+        subplot_titles=[f"物料 {material}" for material in materials]
+    )
+    
+    for row, (material, data) in enumerate(chart_data.groupby('物料编号', sort=False), start=1):
+        hist_data = data[data['类型'] == '历史数据']
+        fore_data = data[data['类型'] == '预测值']
+        
+        fig.add_trace(go.Scatter(
+            x=hist_data['年月'], y=hist_data['数量'], mode='lines+markers',
+            name='历史数据', legendgroup='历史数据', showlegend=row == 1,
+            line=dict(color='#1f77b4')
+        ), row=row, col=1)
+        fig.add_trace(go.Scatter(
+            x=fore_data['年月'], y=fore_data['数量'], mode='lines+markers',
+            name='预测值', legendgroup='预测值', showlegend=row == 1,
+            line=dict(color='#ff7f0e')
+        ), row=row, col=1)
+        
+        # 绘制置信区间
+        if '上限' in fore_data.columns and fore_data['上限'].notna().any():
+            fig.add_trace(go.Scatter(
+                x=fore_data['年月'], y=fore_data['上限'], mode='lines',
+                line=dict(width=0), showlegend=False, hoverinfo='skip'
+            ), row=row, col=1)
+            fig.add_trace(go.Scatter(
+                x=fore_data['年月'], y=fore_data['下限'], mode='lines',
+                line=dict(width=0), fill='tonexty', fillcolor='rgba(255, 127, 14, 0.2)',
+                name='预测区间', legendgroup='预测区间', showlegend=row == 1
+            ), row=row, col=1)
+    
+    fig.update_layout(title=title, height=max(400, 300 * len(materials)))
+    fig.update_yaxes(title_text='数量')
+    
+    return fig
+
+def get_material_groups(data, state_key):
+    """
+    按物料编号拆分数据，数据对象未变化时复用会话状态中的结果
+    
+    参数:
+        data: 包含物料编号、年份、月份的DataFrame，已按物料编号和年月排序
+        state_key: 会话状态中保存分组结果的键
+        
+    返回:
+        dict: 物料编号 -> 该物料的数据
+    """
+    cached = st.session_state.get(state_key)
+    
+    if cached is None or cached[0] is not data:
+        groups = {
+            material: group
+            for material, group in data.groupby('物料编号', sort=False, observed=True)
+        }
+        st.session_state[state_key] = (data, groups)
+        return groups
+    
+    return cached[1]
+
+def get_material_options(data, state_key):
+    """
+    获取排序后的物料编号选项，数据对象未变化时复用会话状态中的结果
+    
+    参数:
+        data: 包含物料编号的DataFrame
+        state_key: 会话状态中保存选项列表的键
+        
+    返回:
+        list: 排序后的物料编号
+    """
+    cached = st.session_state.get(state_key)
+    
+    if cached is None or cached[0] is not data:
+        materials = sorted(data['物料编号'].unique())
+        st.session_state[state_key] = (data, materials)
+        return materials
+    
+    return cached[1]
+
+@st.fragment
+def show_forecast_table(selected_material, all_materials):
+    """
+    显示预测结果数据表及物料筛选
+    
+    参数:
+        selected_material: 选择的特定物料，预测所有物料时为None
+        all_materials: 可供筛选的物料列表
+    """
+    st.write("### 预测结果数据")
+    
+    # 如果选择了特定物料，只显示该物料的预测
+    if selected_material:
+        filtered_forecast = get_material_groups(st.session_state.forecast_data, 'fore_groups').get(selected_material)
+        st.dataframe(filtered_forecast)
+    else:
+        # 添加过滤选项
+        forecast_filter = st.multiselect(
+            "选择物料筛选预测结果",
+            all_materials,
+            default=[]
+        )
+        
+        if forecast_filter:
+            # 从按物料缓存的分组中取出所选物料，无需扫描整张预测表
+            fore_groups = get_material_groups(st.session_state.forecast_data, 'fore_groups')
+            selected_groups = [fore_groups[material] for material in forecast_filter if material in fore_groups]
+            
+            if selected_groups:
+                st.dataframe(pd.concat(selected_groups))
+            else:
+                st.dataframe(st.session_state.forecast_data.iloc[:0])
+        else:
+            # 显示所有预测结果，但限制行数
+            st.dataframe(st.session_state.forecast_data.head(100))
+            
+            if len(st.session_state.forecast_data) > 100:
+                st.info(f"仅显示前100行，共 {len(st.session_state.forecast_data)} 行数据")
+
 # 初始化会话状态
 if 'data_processor' not in st.session_state:
     st.session_state.data_processor = DataProcessor()
@@ -33,8 +232,8 @@ if 'monthly_data' not in st.session_state:
 if 'forecast_data' not in st.session_state:
     st.session_state.forecast_data = None
 
-if 'forecast_charts' not in st.session_state:
-    st.session_state.forecast_charts = {}
+if 'forecast_chart_data' not in st.session_state:
+    st.session_state.forecast_chart_data = None
 
 # 页面标题
 st.title("销售预测")
@@ -100,6 +299,14 @@ with tab1:
             help="选择预测算法，或让系统自动为每种产品选择最合适的方法"
         )
         
+        # 多进程并行预测默认关闭：进程池在Streamlit服务进程内创建，进程数会随并发用户成倍增加
+        parallel_forecast = st.checkbox(
+            "多进程并行预测",
+            value=False,
+            help="预测所有物料时使用全部CPU核心并行计算，适合单人本地使用且物料较多的情况"
+        )
+        forecast_n_jobs = -1 if parallel_forecast else 1
+        
         # 将选择的预测方法转换为算法参数
         method_param = None
         if forecast_method != "自动选择最佳方法":
@@ -120,7 +327,7 @@ with tab2:
         st.info("请先在'数据准备'标签页加载历史数据")
     else:
         # 选择要预测的物料
-        all_materials = sorted(st.session_state.monthly_data['物料编号'].unique())
+        all_materials = get_material_options(st.session_state.monthly_data, 'hist_material_options')
         
         col1, col2 = st.columns([1, 2])
         
@@ -140,76 +347,40 @@ with tab2:
         with col2:
             st.write("### 生成预测")
             
-            if st.button("开始预测"):
+            # 预测参数签名，参数未变化时再次点击不重复计算，也不会覆盖已有的手动调整
+            forecast_signature = (id(st.session_state.monthly_data), forecast_periods, method_param, selected_material)
+            forecast_clicked = st.button("开始预测")
+            
+            if forecast_clicked and st.session_state.get('forecast_signature') == forecast_signature \
+                    and st.session_state.forecast_data is not None:
+                st.info("预测参数未变化，沿用当前预测结果")
+            elif forecast_clicked:
                 with st.spinner("正在生成预测，请稍候..."):
-                    # 确保数据已加载
-                    if st.session_state.forecaster.historical_data is None:
-                        # 加载月度数据
-                        st.session_state.forecaster.load_data(st.session_state.monthly_data)
-                    
-                    # 生成预测
-                    forecast_result = st.session_state.forecaster.generate_forecast(
-                        material_id=selected_material,
-                        method=method_param
+                    # 生成预测（输入未变化时直接使用缓存结果）
+                    forecast_result = run_forecast(
+                        st.session_state.monthly_data,
+                        selected_material,
+                        method_param,
+                        forecast_periods,
+                        forecast_n_jobs
                     )
                     
                     if forecast_result is not None:
                         st.session_state.forecast_data = forecast_result
-                        st.success(f"预测生成成功，共 {len(forecast_result)} 条预测")
+                        st.session_state.forecast_signature = forecast_signature
                         
-                        # 创建图表
-                        st.session_state.forecast_charts = {}
+                        # 同步到预测器，供预测调整使用
+                        st.session_state.forecaster.forecast_data = forecast_result
+                        st.success(f"预测生成成功，共 {len(forecast_result)} 条预测")
                         
                         # 获取要可视化的物料列表
                         materials_to_plot = [selected_material] if selected_material else all_materials[:min(5, len(all_materials))]
                         
-                        for material in materials_to_plot:
-                            fig, ax = plt.subplots(figsize=(10, 6))
-                            
-                            # 筛选该物料的历史数据和预测数据
-                            hist_data = st.session_state.monthly_data[
-                                st.session_state.monthly_data['物料编号'] == material
-                            ].sort_values(['年份', '月份'])
-                            
-                            fore_data = st.session_state.forecast_data[
-                                st.session_state.forecast_data['物料编号'] == material
-                            ].sort_values(['年份', '月份'])
-                            
-                            if hist_data.empty or fore_data.empty:
-                                continue
-                            
-                            # 创建时间标签
-                            hist_labels = [f"{year}-{month}" for year, month in zip(hist_data['年份'], hist_data['月份'])]
-                            fore_labels = [f"{year}-{month}" for year, month in zip(fore_data['年份'], fore_data['月份'])]
-                            
-                            # 绘制历史数据
-                            ax.plot(hist_labels, hist_data['批次数量'], marker='o', label='历史数据')
-                            
-                            # 绘制预测数据
-                            ax.plot(fore_labels, fore_data['预测值'], marker='x', label='预测值')
-                            
-                            # 绘制置信区间
-                            if '下限' in fore_data.columns and '上限' in fore_data.columns:
-                                ax.fill_between(
-                                    fore_labels, 
-                                    fore_data['下限'], 
-                                    fore_data['上限'], 
-                                    alpha=0.2, 
-                                    label='预测区间'
-                                )
-                            
-                            # 添加图表标题和标签
-                            ax.set_title(f"物料 {material} 销售预测")
-                            ax.set_xlabel('年月')
-                            ax.set_ylabel('数量')
-                            ax.legend()
-                            
-                            # 旋转x轴标签
-                            plt.xticks(rotation=45)
-                            plt.tight_layout()
-                            
-                            # 保存图表
-                            st.session_state.forecast_charts[material] = fig
+                        # 按物料拆分历史数据和预测数据，合并为一份图表数据
+                        hist_groups = get_material_groups(st.session_state.monthly_data, 'hist_groups')
+                        fore_groups = get_material_groups(st.session_state.forecast_data, 'fore_groups')
+                        
+                        st.session_state.forecast_chart_data = build_chart_data(hist_groups, fore_groups, materials_to_plot)
                     else:
                         st.error("预测生成失败，请检查历史数据格式是否正确")
             
@@ -217,44 +388,15 @@ with tab2:
             if 'forecast_data' in st.session_state and st.session_state.forecast_data is not None:
                 st.write("### 预测可视化")
                 
-                if st.session_state.forecast_charts:
-                    # 选择要显示的物料图表
-                    chart_materials = list(st.session_state.forecast_charts.keys())
-                    
-                    if chart_materials:
-                        selected_chart = st.selectbox("选择物料查看预测", chart_materials)
-                        
-                        if selected_chart in st.session_state.forecast_charts:
-                            st.pyplot(st.session_state.forecast_charts[selected_chart])
-                
-                # 显示预测结果数据表
-                st.write("### 预测结果数据")
-                
-                # 如果选择了特定物料，只显示该物料的预测
-                if selected_material:
-                    filtered_forecast = st.session_state.forecast_data[
-                        st.session_state.forecast_data['物料编号'] == selected_material
-                    ]
-                    st.dataframe(filtered_forecast)
-                else:
-                    # 添加过滤选项
-                    forecast_filter = st.multiselect(
-                        "选择物料筛选预测结果",
-                        all_materials,
-                        default=[]
+                if st.session_state.forecast_chart_data is not None:
+                    st.plotly_chart(
+                        build_forecast_chart(st.session_state.forecast_chart_data, "销售预测"),
+                        use_container_width=True,
+                        key="forecast_chart"
                     )
-                    
-                    if forecast_filter:
-                        filtered_forecast = st.session_state.forecast_data[
-                            st.session_state.forecast_data['物料编号'].isin(forecast_filter)
-                        ]
-                        st.dataframe(filtered_forecast)
-                    else:
-                        # 显示所有预测结果，但限制行数
-                        st.dataframe(st.session_state.forecast_data.head(100))
-                        
-                        if len(st.session_state.forecast_data) > 100:
-                            st.info(f"仅显示前100行，共 {len(st.session_state.forecast_data)} 行数据")
+                
+                # 显示预测结果数据表（独立片段，筛选时只重新运行该部分）
+                show_forecast_table(selected_material, all_materials)
 
 with tab3:
     st.subheader("预测调整")
@@ -270,17 +412,18 @@ with tab3:
             st.write("### 选择要调整的预测")
             
             # 创建物料、年份和月份的选择器
-            adj_materials = sorted(st.session_state.forecast_data['物料编号'].unique())
+            adj_materials = get_material_options(st.session_state.forecast_data, 'fore_material_options')
             adj_material = st.selectbox("选择物料", adj_materials, key="adj_material")
             
-            # 筛选该物料的预测数据
-            material_forecast = st.session_state.forecast_data[
-                st.session_state.forecast_data['物料编号'] == adj_material
-            ].sort_values(['年份', '月份'])
+            # 获取该物料的预测数据
+            fore_groups = get_material_groups(st.session_state.forecast_data, 'fore_groups')
+            material_forecast = fore_groups[adj_material]
             
             # 创建年月选项
-            adj_periods = [(row['年份'], row['月份']) for _, row in material_forecast.iterrows()]
-            adj_period_labels = [f"{year}年{month}月" for year, month in adj_periods]
+            adj_periods = list(zip(material_forecast['年份'].tolist(), material_forecast['月份'].tolist()))
+            adj_period_labels = (
+                material_forecast['年份'].astype(str) + '年' + material_forecast['月份'].astype(str) + '月'
+            ).tolist()
             
             selected_period_idx = st.selectbox(
                 "选择年月", 
@@ -291,11 +434,8 @@ with tab3:
             # 获取选择的年月
             adj_year, adj_month = adj_periods[selected_period_idx]
             
-            # 获取当前预测值
-            current_forecast = material_forecast[
-                (material_forecast['年份'] == adj_year) & 
-                (material_forecast['月份'] == adj_month)
-            ]['预测值'].iloc[0]
+            # 获取当前预测值（年月选项与预测数据顺序一致，按位置读取）
+            current_forecast = material_forecast['预测值'].to_numpy()[selected_period_idx]
             
             # 创建调整值输入框
             adj_value = st.number_input(
@@ -317,52 +457,23 @@ with tab3:
                         # 更新会话状态中的预测数据
                         st.session_state.forecast_data = st.session_state.forecaster.forecast_data
                         
-                        # 更新图表
-                        if adj_material in st.session_state.forecast_charts:
-                            # 重新创建图表
-                            fig, ax = plt.subplots(figsize=(10, 6))
-                            
-                            # 筛选该物料的历史数据和预测数据
-                            hist_data = st.session_state.monthly_data[
-                                st.session_state.monthly_data['物料编号'] == adj_material
-                            ].sort_values(['年份', '月份'])
-                            
-                            fore_data = st.session_state.forecast_data[
-                                st.session_state.forecast_data['物料编号'] == adj_material
-                            ].sort_values(['年份', '月份'])
-                            
-                            # 创建时间标签
-                            hist_labels = [f"{year}-{month}" for year, month in zip(hist_data['年份'], hist_data['月份'])]
-                            fore_labels = [f"{year}-{month}" for year, month in zip(fore_data['年份'], fore_data['月份'])]
-                            
-                            # 绘制历史数据
-                            ax.plot(hist_labels, hist_data['批次数量'], marker='o', label='历史数据')
-                            
-                            # 绘制预测数据
-                            ax.plot(fore_labels, fore_data['预测值'], marker='x', label='预测值')
-                            
-                            # 绘制置信区间
-                            if '下限' in fore_data.columns and '上限' in fore_data.columns:
-                                ax.fill_between(
-                                    fore_labels, 
-                                    fore_data['下限'], 
-                                    fore_data['上限'], 
-                                    alpha=0.2, 
-                                    label='预测区间'
-                                )
-                            
-                            # 添加图表标题和标签
-                            ax.set_title(f"物料 {adj_material} 销售预测 (含调整)")
-                            ax.set_xlabel('年月')
-                            ax.set_ylabel('数量')
-                            ax.legend()
-                            
-                            # 旋转x轴标签
-                            plt.xticks(rotation=45)
-                            plt.tight_layout()
-                            
-                            # 更新图表
-                            st.session_state.forecast_charts[adj_material] = fig
+                        # 预测数据为原地修改，只需同步被调整物料分组中的对应行，无需重新扫描整表
+                        adjusted_row = material_forecast.index[selected_period_idx]
+                        adjusted_columns = ['预测值', '预测方法']
+                        material_forecast.loc[adjusted_row, adjusted_columns] = (
+                            st.session_state.forecast_data.loc[adjusted_row, adjusted_columns]
+                        )
+                        
+                        # 只更新图表数据中被调整的预测点，无需重建整份图表数据
+                        chart_data = st.session_state.forecast_chart_data
+                        
+                        if chart_data is not None:
+                            adjusted_point = (
+                                (chart_data['物料编号'] == str(adj_material)) &
+                                (chart_data['类型'] == '预测值') &
+                                (chart_data['年月'] == pd.Timestamp(int(adj_year), int(adj_month), 1))
+                            )
+                            chart_data.loc[adjusted_point, '数量'] = adj_value
                         
                         st.success(f"成功调整 {adj_material} 在 {adj_year}年{adj_month}月 的预测值")
                     else:
@@ -372,13 +483,20 @@ with tab3:
             st.write("### 调整后的预测")
             
             # 显示调整后的图表
-            if adj_material in st.session_state.forecast_charts:
-                st.pyplot(st.session_state.forecast_charts[adj_material])
+            chart_data = st.session_state.forecast_chart_data
+            
+            if chart_data is not None:
+                adj_chart_data = chart_data[chart_data['物料编号'] == str(adj_material)]
+                
+                if not adj_chart_data.empty:
+                    st.plotly_chart(
+                        build_forecast_chart(adj_chart_data, f"物料 {adj_material} 销售预测 (含调整)"),
+                        use_container_width=True,
+                        key="adjusted_chart"
+                    )
             
             # 显示调整后的预测数据
-            adj_forecast = st.session_state.forecast_data[
-                st.session_state.forecast_data['物料编号'] == adj_material
-            ].sort_values(['年份', '月份'])
+            adj_forecast = get_material_groups(st.session_state.forecast_data, 'fore_groups')[adj_material]
             
             st.dataframe(adj_forecast)
             
@@ -418,23 +536,21 @@ with tab4:
                 with st.spinner("正在准备导出文件，请稍候..."):
                     try:
                         # 准备导出数据
-                        export_data = st.session_state.forecast_data.copy()
-                        
-                        # 如果不包含上下限，则去除相关列
-                        if not include_bounds and '下限' in export_data.columns and '上限' in export_data.columns:
-                            export_data = export_data.drop(columns=['下限', '上限'])
-                        
-                        # 确保导出目录存在
-                        if not os.path.exists("data/exports"):
-                            os.makedirs("data/exports", exist_ok=True)
+                        # 只选取需要的列，不复制整个预测数据；如果不包含上下限，则去除相关列
+                        export_columns = [
+                            col for col in st.session_state.forecast_data.columns
+                            if include_bounds or col not in ('下限', '上限')
+                        ]
+                        export_data = st.session_state.forecast_data[export_columns]
                         
                         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
                         
                         if export_format == "Excel (.xlsx)":
-                            # 导出为Excel
-                            file_path = f"data/exports/销售预测_{timestamp}.xlsx"
+                            # 导出为Excel，直接写入内存缓冲区
+                            buffer = io.BytesIO()
                             
-                            with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
+                            # xlsxwriter直接生成文件，不在内存中保留完整的工作簿对象
+                            with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
                                 # 写入预测数据
                                 export_data.to_excel(writer, sheet_name='预测数据', index=False)
                                 
@@ -442,29 +558,19 @@ with tab4:
                                 if include_charts:
                                     # 使用pandas的ExcelWriter不能直接添加图表
                                     # 这里我们只能将不同物料的数据分到不同sheet中
-                                    for material in export_data['物料编号'].unique():
-                                        material_data = export_data[export_data['物料编号'] == material]
+                                    for material, material_data in export_data.groupby('物料编号', sort=False, observed=True):
                                         material_data.to_excel(writer, sheet_name=f'物料_{material}', index=False)
                             
-                            # 读取Excel文件内容
-                            with open(file_path, "rb") as file:
-                                excel_bytes = file.read()
-                            
                             # 提供下载链接
                             st.download_button(
                                 label="下载Excel预测文件",
-                                data=excel_bytes,
+                                data=buffer.getvalue(),
                                 file_name=f"销售预测_{timestamp}.xlsx",
                                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                             )
                         else:
                             # 导出为CSV
-                            file_path = f"data/exports/销售预测_{timestamp}.csv"
-                            export_data.to_csv(file_path, index=False, encoding='utf-8-sig')
-                            
-                            # 读取CSV文件内容
-                            with open(file_path, "rb") as file:
-                                csv_bytes = file.read()
+                            csv_bytes = export_data.to_csv(index=False).encode('utf-8-sig')
                             
                             # 提供下载链接
                             st.download_button(
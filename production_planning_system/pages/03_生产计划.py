@@ -1,12 +1,13 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+import plotly.graph_objects as go
 import os
 import sys
 from datetime import datetime
 import io
+import logging
+import traceback
 
 # 添加路径以导入自定义模块
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -14,6 +15,23 @@ from models.forecaster import Forecaster
 from models.data_processor import DataProcessor
 from models.production_planner import ProductionPlanner
 
+logger = logging.getLogger(__name__)
+
+# calamine（Rust实现）解析Excel更快，未安装时使用pandas默认引擎
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = None
+
+# pyarrow的CSV写入器由C++实现，未安装时使用pandas的to_csv
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 # 页面配置
 st.set_page_config(
     page_title="生产计划 - 生产需求系统",
@@ -21,33 +39,227 @@ st.set_page_config(
     layout="wide"
 )
 
-# 初始化会话状态
-if 'data_processor' not in st.session_state:
-    st.session_state.data_processor = DataProcessor()
+@st.cache_data(show_spinner=False)
+def load_uploaded_table(file_name, file_bytes):
+    """解析上传的CSV或Excel文件，按文件名和内容缓存，避免每次重跑都重新解析"""
+    if file_name.endswith('.csv'):
+        return pd.read_csv(io.BytesIO(file_bytes))
+    return pd.read_excel(io.BytesIO(file_bytes), engine=EXCEL_ENGINE)
 
-if 'forecaster' not in st.session_state:
-    st.session_state.forecaster = Forecaster()
+def to_csv_bytes(data):
+    """
+    将数据转为带BOM头的UTF-8 CSV字节，安装了pyarrow时使用其CSV写入器
+    
+    参数:
+        data: 要导出的数据
+        
+    返回:
+        bytes: CSV文件内容
+    """
+    if PYARROW_AVAILABLE:
+        try:
+            buffer = io.BytesIO()
+            pa_csv.write_csv(pa.Table.from_pandas(data, preserve_index=False), buffer)
+            return b'\xef\xbb\xbf' + buffer.getvalue()
+        except pa.ArrowException:
+            # 含有pyarrow无法转换的列时回退到pandas
+            pass
+    
+    return data.to_csv(index=False).encode('utf-8-sig')
 
-if 'production_planner' not in st.session_state:
-    st.session_state.production_planner = ProductionPlanner()
+@st.cache_data(show_spinner=False)
+def run_production_plan(forecast_data, inventory_data, capacity_data, constraints, horizon, objective):
+    """
+    生成优化生产计划，按输入数据和参数缓存，输入未变化时再次生成直接复用上次的计划
+    
+    参数:
+        forecast_data: 预测数据
+        inventory_data: 库存数据，没有时为None
+        capacity_data: 产能数据，没有时为None
+        constraints: 生产约束参数
+        horizon: 优化期数
+        objective: 优化目标
+        
+    返回:
+        tuple: (预测数据是否加载成功, 生产计划DataFrame或None)
+    """
+    planner = ProductionPlanner()
+    planner.set_production_constraints(constraints)
+    
+    # 加载预测数据到生产计划器
+    if not planner.load_forecast_data(forecast_data):
+        return False, None
+    
+    # 加载库存数据（如果有）
+    if inventory_data is not None:
+        planner.load_inventory_data(inventory_data)
+    
+    # 加载产能数据（如果有）
+    if capacity_data is not None:
+        planner.load_capacity_data(capacity_data)
+    
+    return True, planner.optimize_production_plan(horizon=horizon, objective=objective)
 
-if 'forecast_data' not in st.session_state:
-    st.session_state.forecast_data = None
+def make_date_labels(data):
+    """按年份、月份列生成"年-月"格式的横轴标签"""
+    return (data['年份'].astype(str) + '-' + data['月份'].astype(str)).tolist()
 
-if 'inventory_data' not in st.session_state:
-    st.session_state.inventory_data = None
+@st.cache_data(show_spinner=False)
+def build_material_chart(material_plan, title):
+    """
+    绘制单个物料的生产计划图表，按计划数据内容缓存，计划未变化时直接复用
+    
+    参数:
+        material_plan: 该物料按年月排序的计划数据
+        title: 图表标题
+        
+    返回:
+        plotly Figure: 生产计划图表
+    """
+    # 创建时间标签
+    date_labels = make_date_labels(material_plan)
+    
+    # 绘制生产计划、预测需求和库存
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=date_labels, y=material_plan['计划产量'], opacity=0.7, name='计划产量'))
+    fig.add_trace(go.Scatter(x=date_labels, y=material_plan['预测需求'], mode='lines+markers',
+                             marker_symbol='circle', line_color='red', name='预测需求'))
+    fig.add_trace(go.Scatter(x=date_labels, y=material_plan['期末库存'], mode='lines+markers',
+                             marker_symbol='square', line_color='green', name='期末库存'))
+    
+    # 添加图表标题和标签
+    fig.update_layout(title=title, xaxis_title='年月', yaxis_title='数量')
+    
+    return fig
 
-if 'capacity_data' not in st.session_state:
-    st.session_state.capacity_data = None
+@st.cache_data(show_spinner=False)
+def build_total_chart(production_plan, capacity_data):
+    """
+    绘制总体生产负载图表，按计划和产能数据内容缓存
+    
+    参数:
+        production_plan: 生产计划数据
+        capacity_data: 产能数据，没有时为None
+        
+    返回:
+        plotly Figure: 总体生产计划图表
+    """
+    # 按月份汇总生产量
+    # 按年月排序后同月记录相邻，用 reduceat 按段求和
+    sorted_plan = production_plan.sort_values(['年份', '月份'], kind='mergesort')
+    years = sorted_plan['年份'].to_numpy()
+    months = sorted_plan['月份'].to_numpy()
+    starts = np.flatnonzero(np.diff(years * 12 + months, prepend=-1) != 0)
+    
+    monthly_totals = pd.DataFrame({
+        '年份': years[starts],
+        '月份': months[starts],
+        '计划产量': np.add.reduceat(sorted_plan['计划产量'].to_numpy(), starts),
+        '预测需求': np.add.reduceat(sorted_plan['预测需求'].to_numpy(), starts)
+    })
+    
+    # 创建时间标签
+    date_labels = make_date_labels(monthly_totals)
+    
+    # 绘制总生产量和总需求
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=date_labels, y=monthly_totals['计划产量'].to_numpy(), opacity=0.7, name='总计划产量'))
+    fig.add_trace(go.Scatter(x=date_labels, y=monthly_totals['预测需求'].to_numpy(), mode='lines+markers',
+                             line_color='red', name='总预测需求'))
 
-if 'production_plan' not in st.session_state:
-    st.session_state.production_plan = None
+    # 如果有产能数据，显示产能上限
+    if capacity_data is not None:
+        # 按年月汇总各产线的产能上限，没有产能数据的月份记为0
+        capacity_by_month = capacity_data.groupby(['年份', '月份'])['最大产能'].sum()
+        month_keys = pd.MultiIndex.from_arrays([monthly_totals['年份'], monthly_totals['月份']])
+        
+        # 添加产能线
+        capacity_values = capacity_by_month.reindex(month_keys, fill_value=0).to_numpy()
+        
+        fig.add_trace(go.Scatter(x=date_labels, y=capacity_values, mode='lines',
+                                 line=dict(dash='dash', color='black'), name='产能上限'))
+    
+    # 添加图表标题和标签
+    fig.update_layout(title="总体生产计划", xaxis_title='年月', yaxis_title='数量')
+    
+    return fig
 
-if 'production_charts' not in st.session_state:
-    st.session_state.production_charts = {}
+def get_plan_groups(production_plan):
+    """
+    按物料编号拆分生产计划并按年月排序，计划对象未变化时复用会话状态中的结果
+    
+    参数:
+        production_plan: 生产计划数据
+        
+    返回:
+        dict: 物料编号 -> 该物料按年月排序的计划数据
+    """
+    cached = st.session_state.get('plan_groups')
+    
+    if cached is None or cached[0] is not production_plan:
+        sorted_plan = production_plan.sort_values(['年份', '月份'], kind='mergesort')
+        groups = dict(tuple(sorted_plan.groupby('物料编号', sort=False, observed=True)))
+        st.session_state.plan_groups = (production_plan, groups)
+        return groups
+    
+    return cached[1]
+
+def get_production_chart(chart_key):
+    """
+    获取生产计划图表，调整后被标记的物料图表在显示时才重新创建
+    
+    参数:
+        chart_key: 物料编号或'total'
+        
+    返回:
+        Figure: 图表
+    """
+    if chart_key in st.session_state.charts_dirty:
+        material_plan = get_plan_groups(st.session_state.production_plan)[chart_key]
+        st.session_state.production_charts[chart_key] = build_material_chart(
+            material_plan, f"物料 {chart_key} 生产计划 (调整后)"
+        )
+        st.session_state.charts_dirty.discard(chart_key)
+    
+    return st.session_state.production_charts[chart_key]
 
-if 'sales_orders' not in st.session_state:
-    st.session_state.sales_orders = None
+@st.fragment
+def show_plan_table():
+    """显示生产计划数据表及物料筛选，筛选变化时只重跑本片段"""
+    st.write("### 生产计划数据")
+    
+    plan_groups = get_plan_groups(st.session_state.production_plan)
+    
+    # 添加过滤选项
+    plan_filter = st.multiselect(
+        "选择物料筛选计划",
+        list(plan_groups),
+        default=[]
+    )
+    
+    if plan_filter:
+        # 从按物料缓存的分组中取出所选物料，无需扫描整个计划
+        st.dataframe(pd.concat([plan_groups[material] for material in plan_filter]))
+    else:
+        st.dataframe(st.session_state.production_plan)
+
+# 初始化会话状态，默认值以工厂函数给出，只在首次访问时创建对象
+session_defaults = {
+    'data_processor': DataProcessor,
+    'forecaster': Forecaster,
+    'production_planner': ProductionPlanner,
+    'forecast_data': lambda: None,
+    'inventory_data': lambda: None,
+    'capacity_data': lambda: None,
+    'production_plan': lambda: None,
+    'production_charts': dict,
+    'charts_dirty': set,
+    'sales_orders': lambda: None
+}
+
+for key, default_factory in session_defaults.items():
+    if key not in st.session_state:
+        st.session_state[key] = default_factory()
 
 # 页面标题
 st.title("生产计划")
@@ -112,10 +324,7 @@ with tab1:
                 
                 if order_file is not None:
                     try:
-                        if order_file.name.endswith('.csv'):
-                            orders_data = pd.read_csv(order_file)
-                        else:
-                            orders_data = pd.read_excel(order_file)
+                        orders_data = load_uploaded_table(order_file.name, order_file.getvalue())
                         
                         st.success(f"销售订单上传成功，包含 {len(orders_data)} 条记录")
                         
@@ -130,9 +339,8 @@ with tab1:
                         if missing_fields:
                             st.error(f"订单数据缺少必要字段: {', '.join(missing_fields)}")
                         else:
-                            # 处理日期格式
-                            if isinstance(orders_data['要求交期'].iloc[0], str):
-                                orders_data['要求交期'] = pd.to_datetime(orders_data['要求交期'])
+                            # 处理日期格式（已是日期类型时不做转换，重复的日期字符串只解析一次）
+                            orders_data['要求交期'] = pd.to_datetime(orders_data['要求交期'], cache=True)
                             
                             # 添加年月字段
                             orders_data['年份'] = orders_data['要求交期'].dt.year
@@ -176,20 +384,22 @@ with tab1:
                 submitted = st.form_submit_button("添加数据")
                 
                 if submitted:
-                    # 创建预测数据
-                    if 'manual_forecast' not in st.session_state:
-                        st.session_state.manual_forecast = pd.DataFrame(columns=['物料编号', '年份', '月份', '预测值'])
+                    # 输入的行保存在列表中，避免每次提交都复制已有数据
+                    if 'manual_rows' not in st.session_state:
+                        st.session_state.manual_rows = []
                     
                     # 添加新行
-                    new_row = pd.DataFrame({
-                        '物料编号': [material_id],
-                        '年份': [year],
-                        '月份': [month],
-                        '预测值': [quantity]
+                    st.session_state.manual_rows.append({
+                        '物料编号': material_id,
+                        '年份': year,
+                        '月份': month,
+                        '预测值': quantity
                     })
                     
-                    # 合并数据
-                    st.session_state.manual_forecast = pd.concat([st.session_state.manual_forecast, new_row], ignore_index=True)
+                    # 创建预测数据
+                    st.session_state.manual_forecast = pd.DataFrame(
+                        st.session_state.manual_rows, columns=['物料编号', '年份', '月份', '预测值']
+                    )
                     
                     # 更新预测数据
                     st.session_state.forecast_data = st.session_state.manual_forecast
@@ -201,6 +411,7 @@ with tab1:
                 
                 # 添加清除按钮
                 if st.button("清除所有手动输入的数据"):
+                    st.session_state.manual_rows = []
                     st.session_state.manual_forecast = pd.DataFrame(columns=['物料编号', '年份', '月份', '预测值'])
                     st.session_state.forecast_data = None
     
@@ -222,10 +433,7 @@ with tab1:
                 
                 if inventory_file is not None:
                     try:
-                        if inventory_file.name.endswith('.csv'):
-                            inventory_data = pd.read_csv(inventory_file)
-                        else:
-                            inventory_data = pd.read_excel(inventory_file)
+                        inventory_data = load_uploaded_table(inventory_file.name, inventory_file.getvalue())
                         
                         st.success(f"库存数据上传成功，包含 {len(inventory_data)} 条记录")
                         
@@ -287,10 +495,7 @@ with tab1:
                 
                 if capacity_file is not None:
                     try:
-                        if capacity_file.name.endswith('.csv'):
-                            capacity_data = pd.read_csv(capacity_file)
-                        else:
-                            capacity_data = pd.read_excel(capacity_file)
+                        capacity_data = load_uploaded_table(capacity_file.name, capacity_file.getvalue())
                         
                         st.success(f"产能数据上传成功，包含 {len(capacity_data)} 条记录")
                         
@@ -312,15 +517,18 @@ with tab1:
             else:
                 st.write("请设置全局产能约束")
                 
-                # 简化的产能设置，使用单一产能值
-                global_capacity = st.number_input(
-                    "全局月产能上限",
-                    min_value=0,
-                    value=10000,
-                    help="设置所有产品所有月份的总产能上限"
-                )
+                # 简化的产能设置，使用单一产能值，输入时不触发重跑
+                with st.form("capacity_form"):
+                    global_capacity = st.number_input(
+                        "全局月产能上限",
+                        min_value=0,
+                        value=10000,
+                        help="设置所有产品所有月份的总产能上限"
+                    )
+                    
+                    capacity_submitted = st.form_submit_button("应用产能设置")
                 
-                if st.button("应用产能设置"):
+                if capacity_submitted:
                     # 如果有预测数据，创建对应的产能数据
                     if 'forecast_data' in st.session_state and st.session_state.forecast_data is not None:
                         # 获取所有年月组合
@@ -355,88 +563,94 @@ with tab2:
     else:
         st.write("在此设置生产计划的约束参数和优化目标")
         
-        col1, col2 = st.columns(2)
+        with st.form("constraints_form"):
+            col1, col2 = st.columns(2)
         
-        with col1:
-            st.write("### 库存约束")
+            with col1:
+                st.write("### 库存约束")
             
-            safety_stock_days = st.slider(
-                "安全库存天数",
-                min_value=0,
-                max_value=60,
-                value=15,
-                help="设置安全库存水平（以天为单位）"
-            )
+                safety_stock_days = st.slider(
+                    "安全库存天数",
+                    min_value=0,
+                    max_value=60,
+                    value=15,
+                    help="设置安全库存水平（以天为单位）"
+                )
             
-            max_inventory_days = st.slider(
-                "最大库存天数",
-                min_value=safety_stock_days,
-                max_value=120,
-                value=60,
-                help="设置最大允许库存水平（以天为单位）"
-            )
+                max_inventory_days = st.slider(
+                    "最大库存天数",
+                    min_value=0,
+                    max_value=120,
+                    value=60,
+                    help="设置最大允许库存水平（以天为单位）"
+                )
             
-            min_service_level = st.slider(
-                "最小服务水平",
-                min_value=0.5,
-                max_value=1.0,
-                value=0.95,
-                help="设置最小服务水平（满足需求的概率）"
-            )
+                min_service_level = st.slider(
+                    "最小服务水平",
+                    min_value=0.5,
+                    max_value=1.0,
+                    value=0.95,
+                    help="设置最小服务水平（满足需求的概率）"
+                )
         
-        with col2:
-            st.write("### 生产约束")
+            with col2:
+                st.write("### 生产约束")
             
-            min_batch_size = st.number_input(
-                "最小生产批量",
-                min_value=1,
-                value=100,
-                help="设置最小生产批量"
-            )
+                min_batch_size = st.number_input(
+                    "最小生产批量",
+                    min_value=1,
+                    value=100,
+                    help="设置最小生产批量"
+                )
             
-            production_smoothing = st.slider(
-                "生产平滑系数",
-                min_value=0.0,
-                max_value=1.0,
-                value=0.3,
-                help="设置生产平滑系数（0-1，越大波动越小）"
-            )
+                production_smoothing = st.slider(
+                    "生产平滑系数",
+                    min_value=0.0,
+                    max_value=1.0,
+                    value=0.3,
+                    help="设置生产平滑系数（0-1，越大波动越小）"
+                )
             
-            optimization_horizon = st.slider(
-                "优化期数",
-                min_value=1,
-                max_value=24,
-                value=6,
-                help="设置生产计划的优化期数（月）"
-            )
+                optimization_horizon = st.slider(
+                    "优化期数",
+                    min_value=1,
+                    max_value=24,
+                    value=6,
+                    help="设置生产计划的优化期数（月）"
+                )
         
-        st.write("### 优化目标")
+            st.write("### 优化目标")
         
-        optimization_objective = st.radio(
-            "选择优化目标",
-            ["最小化成本", "最大化生产平滑", "最小化库存"],
-            index=0,
-            help="选择生产计划的主要优化目标"
-        )
+            optimization_objective = st.radio(
+                "选择优化目标",
+                ["最小化成本", "最大化生产平滑", "最小化库存"],
+                index=0,
+                help="选择生产计划的主要优化目标"
+            )
         
-        # 将优化目标转换为算法参数
-        objective_param = {
-            "最小化成本": "min_cost",
-            "最大化生产平滑": "smooth_production",
-            "最小化库存": "min_inventory"
-        }.get(optimization_objective)
+            # 将优化目标转换为算法参数
+            objective_param = {
+                "最小化成本": "min_cost",
+                "最大化生产平滑": "smooth_production",
+                "最小化库存": "min_inventory"
+            }.get(optimization_objective)
         
-        # 汇总所有约束参数
-        constraints = {
-            'min_service_level': min_service_level,
-            'min_batch_size': min_batch_size,
-            'safety_stock_days': safety_stock_days,
-            'max_inventory_days': max_inventory_days,
-            'production_smoothing': production_smoothing
-        }
+            # 汇总所有约束参数
+            constraints = {
+                'min_service_level': min_service_level,
+                'min_batch_size': min_batch_size,
+                'safety_stock_days': safety_stock_days,
+                'max_inventory_days': max_inventory_days,
+                'production_smoothing': production_smoothing
+            }
+            
+            # 应用约束按钮，表单内的控件只在提交时触发一次重跑
+            constraints_submitted = st.form_submit_button("应用约束设置")
         
-        # 应用约束按钮
-        if st.button("应用约束设置"):
+        if constraints_submitted:
+            # 表单内滑块之间不能联动，提交时保证最大库存天数不低于安全库存天数
+            constraints['max_inventory_days'] = max(max_inventory_days, safety_stock_days)
+            
             # 保存约束参数到会话状态
             st.session_state.production_constraints = constraints
             st.session_state.optimization_objective = objective_param
@@ -466,112 +680,57 @@ with tab3:
             if st.button("​生成优化生产计划​"):
                 with st.spinner("正在优化生产计划，请稍候..."):
                     try:
-                        # 加载预测数据到生产计划器
-                        if st.session_state.production_planner.load_forecast_data(st.session_state.forecast_data):
-                            # 加载库存数据（如果有）
-                            if 'inventory_data' in st.session_state and st.session_state.inventory_data is not None:
-                                st.session_state.production_planner.load_inventory_data(st.session_state.inventory_data)
-                            
-                            # 加载产能数据（如果有）
-                            if 'capacity_data' in st.session_state and st.session_state.capacity_data is not None:
-                                st.session_state.production_planner.load_capacity_data(st.session_state.capacity_data)
-                            
-                            # 生成优化生产计划
-                            plan = st.session_state.production_planner.optimize_production_plan(
-                                horizon=st.session_state.optimization_horizon,
-                                objective=st.session_state.optimization_objective
-                            )
-                            
+                        # 生成优化生产计划（输入数据和参数未变化时直接使用缓存结果）
+                        forecast_loaded, plan = run_production_plan(
+                            st.session_state.forecast_data,
+                            st.session_state.get('inventory_data'),
+                            st.session_state.get('capacity_data'),
+                            st.session_state.production_constraints,
+                            st.session_state.optimization_horizon,
+                            st.session_state.optimization_objective
+                        )
+                        
+                        if forecast_loaded:
                             if plan is not None:
+                                # 同步到生产计划器，供计划调整使用
+                                st.session_state.production_planner.production_plan = plan
                                 st.session_state.production_plan = plan
                                 st.success(f"生产计划生成成功，共 {len(plan)} 条记录")
                                 
                                 # 创建图表
                                 st.session_state.production_charts = {}
+                                st.session_state.charts_dirty = set()
+                                
+                                # 按物料拆分计划数据
+                                plan_groups = get_plan_groups(st.session_state.production_plan)
                                 
                                 # 取所有物料的前5个进行可视化
-                                materials_to_plot = st.session_state.production_plan['物料编号'].unique()[:min(5, len(st.session_state.production_plan['物料编号'].unique()))]
+                                materials_to_plot = list(plan_groups)[:5]
                                 
                                 for material in materials_to_plot:
-                                    fig, ax = plt.subplots(figsize=(10, 6))
-                                    
-                                    # 筛选该物料的计划数据
-                                    material_plan = st.session_state.production_plan[
-                                        st.session_state.production_plan['物料编号'] == material
-                                    ].sort_values(['年份', '月份'])
-                                    
-                                    # 创建时间标签
-                                    date_labels = [f"{year}-{month}" for year, month in zip(material_plan['年份'], material_plan['月份'])]
-                                    
-                                    # 绘制生产计划、预测需求和库存
-                                    ax.bar(date_labels, material_plan['计划产量'], alpha=0.7, label='计划产量')
-                                    ax.plot(date_labels, material_plan['预测需求'], marker='o', color='red', label='预测需求')
-                                    ax.plot(date_labels, material_plan['期末库存'], marker='s', color='green', label='期末库存')
-                                    
-                                    # 添加图表标题和标签
-                                    ax.set_title(f"物料 {material} 生产计划")
-                                    ax.set_xlabel('年月')
-                                    ax.set_ylabel('数量')
-                                    ax.legend()
-                                    
-                                    # 旋转x轴标签
-                                    plt.xticks(rotation=45)
-                                    plt.tight_layout()
+                                    material_plan = plan_groups[material]
                                     
                                     # 保存图表
-                                    st.session_state.production_charts[material] = fig
+                                    st.session_state.production_charts[material] = build_material_chart(
+                                        material_plan, f"物料 {material} 生产计划"
+                                    )
                                 
                                 # 创建整体生产负载图
-                                fig, ax = plt.subplots(figsize=(10, 6))
-                                
-                                # 按月份汇总生产量
-                                total_production = st.session_state.production_plan.groupby(['年份', '月份'])['计划产量'].sum().reset_index()
-                                total_demand = st.session_state.production_plan.groupby(['年份', '月份'])['预测需求'].sum().reset_index()
-                                
-                                # 创建时间标签
-                                date_labels = [f"{year}-{month}" for year, month in zip(total_production['年份'], total_production['月份'])]
-                                
-                                # 绘制总生产量和总需求
-                                ax.bar(date_labels, total_production['计划产量'], alpha=0.7, label='总计划产量')
-                                ax.plot(date_labels, total_demand['预测需求'], marker='o', color='red', label='总预测需求')
-
-                                # 如果有产能数据，显示产能上限
-                                if 'capacity_data' in st.session_state and st.session_state.capacity_data is not None:
-                                    # 尝试获取每月的产能上限
-                                    capacity_by_month = {}
-                                    for _, row in st.session_state.capacity_data.iterrows():
-                                        key = (row['年份'], row['月份'])
-                                        if key not in capacity_by_month:
-                                            capacity_by_month[key] = 0
-                                        capacity_by_month[key] += row['最大产能']
-                                    
-                                    # 添加产能线
-                                    capacity_values = []
-                                    for year, month in zip(total_production['年份'], total_production['月份']):
-                                        capacity_values.append(capacity_by_month.get((year, month), 0))
-                                    
-                                    ax.plot(date_labels, capacity_values, linestyle='--', color='black', label='产能上限')
-                                
-                                # 添加图表标题和标签
-                                ax.set_title("总体生产计划")
-                                ax.set_xlabel('年月')
-                                ax.set_ylabel('数量')
-                                ax.legend()
-                                
-                                # 旋转x轴标签
-                                plt.xticks(rotation=45)
-                                plt.tight_layout()
-                                
-                                # 保存图表
-                                st.session_state.production_charts['total'] = fig
+                                st.session_state.production_charts['total'] = build_total_chart(
+                                    st.session_state.production_plan,
+                                    st.session_state.get('capacity_data')
+                                )
                             else:
                                 st.error("生产计划生成失败，请检查数据和约束设置")
                         else:
                             st.error("加载预测数据失败")
                     except Exception as e:
+                        logger.exception(f"生成生产计划时出错: {str(e)}")
                         st.error(f"生成生产计划时出错: {str(e)}")
-                        import traceback
-                        st.error(traceback.format_exc())
+                        
+                        # 完整堆栈只在调试模式下显示，日志中始终保留
+                        if st.session_state.get('debug', False):
+                            st.code(traceback.format_exc())
         
         with col2:
             st.write("### 计划可视化")
@@ -584,26 +743,11 @@ with tab3:
                 
                 # 显示选中的图表
                 if selected_chart in st.session_state.production_charts:
-                    st.pyplot(st.session_state.production_charts[selected_chart])
+                    st.plotly_chart(get_production_chart(selected_chart), use_container_width=True, key="plan_chart")
             
             # 显示生产计划数据表
             if 'production_plan' in st.session_state and st.session_state.production_plan is not None:
-                st.write("### 生产计划数据")
-                
-                # 添加过滤选项
-                plan_filter = st.multiselect(
-                    "选择物料筛选计划",
-                    st.session_state.production_plan['物料编号'].unique(),
-                    default=[]
-                )
-                
-                if plan_filter:
-                    filtered_plan = st.session_state.production_plan[
-                        st.session_state.production_plan['物料编号'].isin(plan_filter)
-                    ]
-                    st.dataframe(filtered_plan)
-                else:
-                    st.dataframe(st.session_state.production_plan)
+                show_plan_table()
 
 with tab4:
     st.subheader("生产计划调整")
@@ -620,17 +764,19 @@ with tab4:
             st.write("### 选择要调整的计划")
             
             # 创建物料、年份和月份的选择器
-            adj_materials = sorted(st.session_state.production_plan['物料编号'].unique())
+            # 物料列表取自按物料拆分的计划分组，无需重新扫描整个计划
+            plan_groups = get_plan_groups(st.session_state.production_plan)
+            adj_materials = sorted(plan_groups)
             adj_material = st.selectbox("选择物料", adj_materials, key="adj_plan_material")
             
-            # 筛选该物料的计划数据
-            material_plan = st.session_state.production_plan[
-                st.session_state.production_plan['物料编号'] == adj_material
-            ].sort_values(['年份', '月份'])
+            # 获取该物料的计划数据
+            material_plan = plan_groups[adj_material]
             
             # 创建年月选项
-            adj_periods = [(row['年份'], row['月份']) for _, row in material_plan.iterrows()]
-            adj_period_labels = [f"{year}年{month}月" for year, month in adj_periods]
+            adj_periods = list(zip(material_plan['年份'].tolist(), material_plan['月份'].tolist()))
+            adj_period_labels = (
+                material_plan['年份'].astype(str) + '年' + material_plan['月份'].astype(str) + '月'
+            ).tolist()
             
             selected_period_idx = st.selectbox(
                 "选择年月", 
@@ -642,11 +788,8 @@ with tab4:
             # 获取选择的年月
             adj_year, adj_month = adj_periods[selected_period_idx]
             
-            # 获取当前计划产量
-            current_production = material_plan[
-                (material_plan['年份'] == adj_year) & 
-                (material_plan['月份'] == adj_month)
-            ]['计划产量'].iloc[0]
+            # 获取当前计划产量，年月选项与物料计划逐行对应，按位置直接取值
+            current_production = material_plan['计划产量'].iat[selected_period_idx]
             
             # 创建调整值输入框
             adj_production = st.number_input(
@@ -669,36 +812,13 @@ with tab4:
                             # 更新会话状态中的生产计划
                             st.session_state.production_plan = st.session_state.production_planner.production_plan
                             
-                            # 更新图表
+                            # 计划为原地修改且只影响被调整的物料，按行标签刷新该物料的分组即可
+                            plan_groups = get_plan_groups(st.session_state.production_plan)
+                            plan_groups[adj_material] = st.session_state.production_plan.loc[plan_groups[adj_material].index]
+                            
+                            # 标记图表待更新，连续调整时只在显示图表时重新创建一次
                             if adj_material in st.session_state.production_charts:
-                                # 重新创建图表
-                                fig, ax = plt.subplots(figsize=(10, 6))
-                                
-                                # 筛选该物料的计划数据
-                                updated_plan = st.session_state.production_plan[
-                                    st.session_state.production_plan['物料编号'] == adj_material
-                                ].sort_values(['年份', '月份'])
-                                
-                                # 创建时间标签
-                                date_labels = [f"{year}-{month}" for year, month in zip(updated_plan['年份'], updated_plan['月份'])]
-                                
-                                # 绘制生产计划、预测需求和库存
-                                ax.bar(date_labels, updated_plan['计划产量'], alpha=0.7, label='计划产量')
-                                ax.plot(date_labels, updated_plan['预测需求'], marker='o', color='red', label='预测需求')
-                                ax.plot(date_labels, updated_plan['期末库存'], marker='s', color='green', label='期末库存')
-                                
-                                # 添加图表标题和标签
-                                ax.set_title(f"物料 {adj_material} 生产计划 (调整后)")
-                                ax.set_xlabel('年月')
-                                ax.set_ylabel('数量')
-                                ax.legend()
-                                
-                                # 旋转x轴标签
-                                plt.xticks(rotation=45)
-                                plt.tight_layout()
-                                
-                                # 更新图表
-                                st.session_state.production_charts[adj_material] = fig
+                                st.session_state.charts_dirty.add(adj_material)
                             
                             st.success(f"成功调整 {adj_material} 在 {adj_year}年{adj_month}月 的计划产量")
                         else:
@@ -711,13 +831,11 @@ with tab4:
             
             # 显示调整后的图表
             if 'production_charts' in st.session_state and adj_material in st.session_state.production_charts:
-                st.pyplot(st.session_state.production_charts[adj_material])
+                st.plotly_chart(get_production_chart(adj_material), use_container_width=True, key="adjusted_plan_chart")
             
             # 显示调整后的计划数据
             if 'production_plan' in st.session_state and st.session_state.production_plan is not None:
-                adj_plan = st.session_state.production_plan[
-                    st.session_state.production_plan['物料编号'] == adj_material
-                ].sort_values(['年份', '月份'])
+                adj_plan = get_plan_groups(st.session_state.production_plan)[adj_material]
                 
                 st.dataframe(adj_plan)
 
@@ -749,50 +867,51 @@ with tab5:
             if st.button("生成导出文件"):
                 with st.spinner("正在准备导出文件，请稍候..."):
                     try:
-                        # 准备导出数据
-                        export_data = st.session_state.production_plan.copy()
-                        
-                        # 确保导出目录存在
-                        if not os.path.exists("data/exports"):
-                            os.makedirs("data/exports", exist_ok=True)
+                        # 准备导出数据，导出只读取计划，无需复制
+                        export_data = st.session_state.production_plan
                         
                         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
                         
                         if export_format == "Excel (.xlsx)":
-                            # 导出为Excel
-                            file_path = f"data/exports/生产计划_{timestamp}.xlsx"
+                            # 导出为Excel，直接写入内存缓冲区
+                            buffer = io.BytesIO()
                             
-                            with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
+                            # xlsxwriter直接生成文件，不在内存中保留完整的工作簿对象；
+                            # 关闭URL识别，写入字符串时无需逐个匹配链接格式
+                            with pd.ExcelWriter(
+                                buffer,
+                                engine='xlsxwriter',
+                                engine_kwargs={'options': {'strings_to_urls': False}}
+                            ) as writer:
                                 # 写入计划数据
                                 export_data.to_excel(writer, sheet_name='生产计划', index=False)
                                 
-                                # 如果包含图表，为每个物料创建单独的sheet
+                                # 如果包含图表，按物料透视计划产量
                                 if include_charts:
                                     # 使用pandas的ExcelWriter不能直接添加图表
-                                    # 这里我们只能将不同物料的数据分到不同sheet中
-                                    for material in export_data['物料编号'].unique():
-                                        material_data = export_data[export_data['物料编号'] == material]
-                                        material_data.to_excel(writer, sheet_name=f'物料_{material}', index=False)
-                            
-                            # 读取Excel文件内容
-                            with open(file_path, "rb") as file:
-                                excel_bytes = file.read()
+                                    # 所有物料合并到一个透视sheet中：每行一个年月，每列一个物料
+                                    wide_plan = export_data.pivot_table(
+                                        index=['年份', '月份'],
+                                        columns='物料编号',
+                                        values='计划产量',
+                                        aggfunc='sum',
+                                        observed=True
+                                    ).reset_index()
+                                    wide_plan.to_excel(writer, sheet_name='分物料透视', index=False)
+                                    
+                                    # 冻结表头和年月列
+                                    writer.sheets['分物料透视'].freeze_panes(1, 2)
                             
                             # 提供下载链接
                             st.download_button(
                                 label="下载Excel计划文件",
-                                data=excel_bytes,
+                                data=buffer.getvalue(),
                                 file_name=f"生产计划_{timestamp}.xlsx",
                                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                             )
                         else:
                             # 导出为CSV
-                            file_path = f"data/exports/生产计划_{timestamp}.csv"
-                            export_data.to_csv(file_path, index=False, encoding='utf-8-sig')
-                            
-                            # 读取CSV文件内容
-                            with open(file_path, "rb") as file:
-                                csv_bytes = file.read()
+                            csv_bytes = to_csv_bytes(export_data)
                             
                             # 提供下载链接
                             st.download_button(